@@ -0,0 +1,276 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+
+from sqlalchemy import Boolean, DateTime, Integer, select
+
+from availability import free_slots
+from models import db, Venue, Artist, Show, venue_genres, artist_genres
+from pagination import keyset_page, page_size
+from queries import genre_names, split_genres, with_genre
+
+#----------------------------------------------------------------------------#
+# JSON API (/api/v1).
+#----------------------------------------------------------------------------#
+
+# Each resource maps its public field names to column expressions. A request's
+# fields= picks the columns that are selected, and a show listing only joins
+# Venue or Artist when it asks for one of their fields. Pages use the same
+# keyset pagination as the HTML views.
+#
+# Rows are encoded by a function built once per fieldset from one encoder per
+# field, which concatenates each row's JSON text directly. This skips the
+# per-row dict and the generic json.dumps walk (benchmarks/bench_api.py).
+
+API_VERSION = 'v1'
+
+# The longest window one availability request may span, and the default one.
+MAX_AVAILABILITY_RANGE = timedelta(days=92)
+DEFAULT_AVAILABILITY_RANGE = timedelta(days=30)
+
+
+class ApiError(ValueError):
+  pass
+
+
+class Resource:
+
+  def __init__(self, model, fields, keys, joins=None, filters=None):
+    self.model = model
+    self.fields = fields          # name -> column expression, in output order
+    self.keys = keys              # ascending, unique sort key for cursors
+    self.joins = joins or {}      # field name -> (model, onclause) it needs
+    self.filters = filters or {}  # query argument -> fn(statement, value)
+
+  def fieldset(self, value):
+    if not value:
+      return tuple(self.fields)
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in self.fields]
+    if unknown or not names:
+      raise ApiError(f'unknown fields: {", ".join(unknown) or value!r}; choose from {", ".join(self.fields)}')
+    return names
+
+  def select(self, names):
+    # The requested fields, then the sort key, which is never written out.
+    columns = [self.fields[name].label(name) for name in names]
+    keys = [key.label(f'_key_{index}') for index, key in enumerate(self.keys)]
+    statement = select(*columns, *keys).select_from(self.model)
+    joined = []
+    for name in names:
+      join = self.joins.get(name)
+      if join is not None and join[0] not in joined:
+        joined.append(join[0])
+        statement = statement.join(*join)
+    return statement
+
+
+def by_genre(link_table, owner_column, model):
+  return lambda statement, genre: statement.where(model.id.in_(with_genre(link_table, owner_column, genre)))
+
+
+def equals(column, cast=str):
+  def apply(statement, value):
+    try:
+      return statement.where(column == cast(value))
+    except ValueError:
+      raise ApiError(f'invalid {column.key}: {value!r}')
+  return apply
+
+
+def when(statement, value):
+  if value not in ('upcoming', 'past'):
+    raise ApiError("when must be 'upcoming' or 'past'")
+  now = datetime.now()
+  return statement.where(Show.start_time > now if value == 'upcoming' else Show.start_time <= now)
+
+
+RESOURCES = {
+  'venues': Resource(Venue, {
+    'id': Venue.id,
+    'name': Venue.name,
+    'genres': genre_names(venue_genres, venue_genres.c.venue_id, Venue.id),
+    'address': Venue.address,
+    'city': Venue.city,
+    'state': Venue.state,
+    'phone': Venue.phone,
+    'website': Venue.website_link,
+    'facebook_link': Venue.facebook_link,
+    'seeking_talent': Venue.seeking_talent,
+    'seeking_description': Venue.seeking_description,
+    'image_link': Venue.image_link,
+    'updated_at': Venue.updated_at,
+  }, keys=[Venue.id], filters={
+    'genre': by_genre(venue_genres, venue_genres.c.venue_id, Venue),
+    'state': equals(Venue.state),
+    'city': equals(Venue.city),
+  }),
+  'artists': Resource(Artist, {
+    'id': Artist.id,
+    'name': Artist.name,
+    'genres': genre_names(artist_genres, artist_genres.c.artist_id, Artist.id),
+    'city': Artist.city,
+    'state': Artist.state,
+    'phone': Artist.phone,
+    'website': Artist.website_link,
+    'facebook_link': Artist.facebook_link,
+    'seeking_venue': Artist.seeking_venue,
+    'seeking_description': Artist.seeking_description,
+    'image_link': Artist.image_link,
+    'updated_at': Artist.updated_at,
+  }, keys=[Artist.id], filters={
+    'genre': by_genre(artist_genres, artist_genres.c.artist_id, Artist),
+    'state': equals(Artist.state),
+  }),
+  # The columns of queries.show_rows_select plus end_time, joined only on demand.
+  'shows': Resource(Show, {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'end_time': Show.end_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'venue_image_link': Venue.image_link,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+  }, keys=[Show.start_time, Show.id], joins={
+    'venue_name': (Venue, Venue.id == Show.venue_id),
+    'venue_image_link': (Venue, Venue.id == Show.venue_id),
+    'artist_name': (Artist, Artist.id == Show.artist_id),
+    'artist_image_link': (Artist, Artist.id == Show.artist_id),
+  }, filters={
+    'venue_id': equals(Show.venue_id, int),
+    'artist_id': equals(Show.artist_id, int),
+    'when': when,
+  }),
+}
+
+# ---------------------------------------------------------------------------#
+# Row encoders
+# ---------------------------------------------------------------------------#
+# One function per kind of value, writing its JSON text.
+
+def encode_string(value):
+  return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def encode_integer(value):
+  return 'null' if value is None else str(value)
+
+
+def encode_boolean(value):
+  return 'null' if value is None else 'true' if value else 'false'
+
+
+def encode_datetime(value):
+  return 'null' if value is None else '"' + value.isoformat() + '"'
+
+
+def encode_genres(value):
+  return '[' + ','.join(map(encode_basestring_ascii, split_genres(value))) + ']'
+
+
+ENCODE = {
+  'string': encode_string,
+  'integer': encode_integer,
+  'boolean': encode_boolean,
+  'datetime': encode_datetime,
+  'genres': encode_genres,
+}
+
+
+def value_kind(name, expression):
+  if name == 'genres':
+    return 'genres'
+  for kind, type_ in (('boolean', Boolean), ('integer', Integer), ('datetime', DateTime)):
+    if isinstance(expression.type, type_):
+      return kind
+  return 'string'
+
+
+@lru_cache(maxsize=256)
+def row_encoder(kind, names):
+  # Returns encode(rows) -> the rows as comma-separated JSON objects. Each
+  # field pairs its quoted key with its value encoder; zip() stops before the
+  # sort key columns at the end of each row.
+  resource = RESOURCES[kind]
+  fields = [(encode_basestring_ascii(name) + ':', ENCODE[value_kind(name, resource.fields[name])])
+            for name in names]
+
+  def encode(rows):
+    return ','.join(['{' + ','.join([key + encode_value(value) for (key, encode_value), value in zip(fields, row)]) + '}'
+                     for row in rows])
+  return encode
+
+
+def encode_cursor_value(cursor):
+  return 'null' if cursor is None else encode_basestring_ascii(cursor)
+
+# ---------------------------------------------------------------------------#
+# Requests
+# ---------------------------------------------------------------------------#
+
+def listing(kind, args, session=None):
+  # The JSON body of one page of a collection.
+  session = db.session if session is None else session
+  resource = RESOURCES[kind]
+  names = resource.fieldset(args.get('fields'))
+  statement = resource.select(names)
+  for argument, apply in resource.filters.items():
+    if args.get(argument):
+      statement = apply(statement, args[argument])
+  offset = len(names)
+  page = keyset_page(statement, resource.keys, lambda row: tuple(row[offset:]),
+                     args.get('after'), args.get('before'), page_size(args.get('limit')),
+                     fetch=lambda statement: session.connection().execute(statement).all())
+  return (f'{{"data":[{row_encoder(kind, names)(page["data"])}],'
+          f'"next_cursor":{encode_cursor_value(page["next_cursor"])},'
+          f'"prev_cursor":{encode_cursor_value(page["prev_cursor"])}}}')
+
+
+def detail(kind, id, args, session=None):
+  # The JSON body for one resource, or None when it does not exist.
+  session = db.session if session is None else session
+  resource = RESOURCES[kind]
+  names = resource.fieldset(args.get('fields'))
+  rows = session.connection().execute(resource.select(names).where(resource.model.id == id)).all()
+  if not rows:
+    return None
+  return f'{{"data":{row_encoder(kind, names)(rows)}}}'
+
+
+def time_argument(args, name, default):
+  if not args.get(name):
+    return default
+  try:
+    return datetime.fromisoformat(args[name])
+  except ValueError:
+    raise ApiError(f'{name} must be an ISO 8601 date and time, got {args[name]!r}')
+
+
+def availability(venue_id, args, session=None):
+  # The JSON body listing the free slots of a venue between from= and to=
+  # (default: 30 days after from), at least min_length= minutes long, or None
+  # when the venue does not exist. from= is required: the ETag covers the
+  # query string and the venue's writes, not the clock.
+  session = db.session if session is None else session
+  if not args.get('from'):
+    raise ApiError('from is required')
+  start = time_argument(args, 'from', None)
+  end = time_argument(args, 'to', start + DEFAULT_AVAILABILITY_RANGE)
+  if end <= start:
+    raise ApiError('to must be after from')
+  if end - start > MAX_AVAILABILITY_RANGE:
+    raise ApiError(f'from and to may be at most {MAX_AVAILABILITY_RANGE.days} days apart')
+  min_length = None
+  if args.get('min_length'):
+    try:
+      min_length = timedelta(minutes=int(args['min_length']))
+    except ValueError:
+      raise ApiError(f'invalid min_length: {args["min_length"]!r}')
+  conn = session.connection()
+  if conn.execute(select(Venue.id).where(Venue.id == venue_id)).first() is None:
+    return None
+  slots = free_slots(conn, venue_id, start, end, min_length)
+  return '{"data":[' + ','.join(f'{{"start":"{slot_start.isoformat()}","end":"{slot_end.isoformat()}"}}'
+                                for slot_start, slot_end in slots) + ']}'
@@ -4,9 +4,8 @@
 
 import json
 import sys
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
@@ -14,6 +13,26 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from models import db, Genre, Venue, Artist, Show
+from queries import venue_areas, artist_page, show_page, venue_detail, artist_detail
+from plans import check_plans
+from search import search_page, search_json
+from pagination import page_size
+from cache import PageCache, pages_for, tags_for, warm_pages
+from jobs import JobQueue
+from formatting import format_datetime, format_datetimes
+from importer import Importer, KINDS as IMPORT_KINDS
+from pool import init_app as init_pool, pool_stats
+from routing import init_app as init_replicas, read_only
+from profiling import init_app as init_profiling
+from assets import init_app as init_assets, build as build_assets
+from freshness import init_app as init_freshness, conditional, venue_freshness, artist_freshness, venues_freshness, artists_freshness, shows_freshness
+from partitions import PartitionError, maintain as maintain_partitions
+from counters import age as age_shows, recount as recount_shows
+from scheduling import ScheduleError, schedule_shows
+from availability import BookingConflict, BookingError
+from api import API_VERSION, ApiError, listing as api_listing, detail as api_detail, availability as api_availability
+from exporter import EXPORTS, FORMATS as EXPORT_FORMATS, ExportError, export_chunks
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,141 +40,29 @@ from flask_migrate import Migrate
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db.init_app(app)
 migrate = Migrate(app, db)
+page_cache = PageCache(app)
+jobs = JobQueue(app)
+init_pool(app)
+init_replicas(app)
+init_profiling(app)
+init_assets(app)
+init_freshness(app)
 
 # DONE: connect to a local postgresql database
 
-#----------------------------------------------------------------------------#
-# Models.
-#----------------------------------------------------------------------------#
-
-class Venue(db.Model):
-    __tablename__ = 'Venue'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(150))
-    phone = db.Column(db.String(120))
-    genres = db.Column((db.String()))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    website_link = db.Column(db.String(500))
-    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
-    seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='venue', lazy=True)
-
-    def _repr_(self):
-      return f'< Venue {self.id} {self.name} {self.city}>'
-
-    # DONE: implement any missing fields, as a database migration using Flask-Migrate
-
-class Artist(db.Model):
-    __tablename__ = 'Artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    website_link = db.Column(db.String(500))
-    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
-    seeking_description = db.Column(db.String(500))
-
-    shows = db.relationship('Show', backref='artist', lazy=True)
-
-    def _repr_(self):
-      return f'< Artist {self.id} {self.name} {self.city}>'
-
-      
-    # DONE: implement any missing fields, as a database migration using Flask-Migrate
-
-# DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
-
-class Show(db.Model):
-    __tablename__ = 'Show'
-    id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    start_time = db.Column(db.DateTime, default=datetime.today(), nullable=False)
-
-    def __repr__(self):
-        return f'<Show {self.id} {self.artist_id} {self.venue_id} {self.start_time}>'
-
-    # DONE: implement any missing fields, as a database migration using Flask-Migrate
-
-# DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
-
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  # date = dateutil.parser.parse(value)
-  if isinstance(value, str):
-        date = dateutil.parser.parse(value)
-  else:
-        date = value
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['datetimes'] = format_datetimes
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-
-# ---------------------------------------------------------------------------#
-#  Functions For Search Implementation
-# ---------------------------------------------------------------------------#
-def search_item(query_table, val):
-  search_term = request.form.get('search_term', '')
-  items = db.session.query(query_table).filter(query_table.name.ilike(f'%{search_term}%')).all()
-  num_items = len(items)
-
-  search_result = {
-    "count": num_items,
-    "data": items,
-  }
-  if val == 1:
-    return search_result
-  elif val == 2:
-    return search_term
-
-# ---------------------------------------------------------------------------#
-# Get cities and states without duplicate
-# ---------------------------------------------------------------------------#
-def city_state_no_duplicate(table1_name, table2_name):
-  places = db.session.query(table1_name.city, table1_name.state).distinct(table1_name.city, table1_name.state).all()
-  city_state = []
-  venue_params = []
-
-  for place in places:
-    result = table1_name.query.filter(table1_name.state == place.state).filter(table1_name.city == place.city).all()
-
-    for params in result:
-      venue_params.append({
-        "id": params.id,
-        "name": params.name,
-        "num_upcoming_shows": len(db.session.query(table2_name).filter(table2_name.start_time > datetime.now()).all())
-      })
-
-      city_state.append({
-        "city": place.city,
-        "state": place.state,
-        "venues": venue_params,
-      })
-  return city_state
-
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -165,73 +72,48 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@read_only
+@conditional(venues_freshness)
+@page_cache.cached(['venues'])
 def venues():
   # DONE: replace with real venues data.
   # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
 
-  # To get cities and states and avoid duplicates
+  # Areas, venues and their upcoming-show counts come from a single grouped query
 
-  return render_template('pages/venues.html', areas=city_state_no_duplicate(Venue, Show))
+  return render_template('pages/venues.html', areas=venue_areas(genre=request.args.get('genre'), state=request.args.get('state')))
 
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
   # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-  return render_template('pages/search_venues.html', results=search_item(Venue, 1), search_term=search_item(Venue, 2))
+  search_term = request.form.get('search_term', '')
+  results = search_page(Venue, search_term, request.form.get('cursor'), page_size(request.form.get('limit')))
+  return render_template('pages/search_venues.html', results=results, search_term=search_term)
+
+@app.route('/venues/search.json')
+@read_only
+def search_venues_json():
+  # Typeahead endpoint: same search service, JSON out.
+  search_term = request.args.get('search_term', '')
+  results = search_page(Venue, search_term, request.args.get('cursor'), page_size(request.args.get('limit')))
+  return jsonify(search_json(results))
 
 @app.route('/venues/<int:venue_id>')
+@read_only
+@conditional(venue_freshness)
+@page_cache.cached(lambda venue_id: ['venue', f'venue:{venue_id}'])
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # DONE: replace with real venue data from the venues table, using venue_id
 
-  artist_past_venues = db.session.query(Show).filter(Show.start_time < datetime.now(), Show.venue_id == venue_id).join(Artist, Show.venue_id == Artist.id).add_columns(Artist.id, Artist.name, Artist.image_link, Show.start_time).all()
-
-  artist_upcoming_venues = db.session.query(Show).filter(Show.start_time > datetime.now(), Show.venue_id == venue_id).join(Artist, Show.venue_id == Artist.id).add_columns(Artist.id, Artist.name, Artist.image_link, Show.start_time).all()
-
-  venue_details = Venue.query.filter(Venue.id == venue_id).first()
-
-  past = []
-
-  upcomings = []
-
-  for show in artist_past_venues:
-    past.append({
-      "artist_id": show[1],
-      "artist_name": show[2],
-      "artist_image_link": show[3],
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M"),
-    })
-
-  for upcoming in artist_upcoming_venues:
-      upcomings.append({
-      "artist_id": upcoming[1],
-      "artist_name": upcoming[2],
-      "artist_image_link": upcoming[3],
-      "start_time": upcoming.start_time.strftime("%m/%d/%Y, %H:%M"),
-      })
-
-  data = {
-              "id": venue_details.id,
-              "name": venue_details.name,
-              "genres": venue_details.genres,
-              "address":venue_details.address,
-              "city": venue_details.city,
-              "state": venue_details.state,
-              "phone": venue_details.phone,
-              "website": venue_details.website_link,
-              "facebook_link": venue_details.facebook_link,
-              "seeking_talent": venue_details.seeking_talent,
-              "seeking_description": venue_details.seeking_description,
-              "image_link": venue_details.image_link,
-              "past_shows": past,
-              "upcoming_shows": upcomings,
-              "past_shows_count": len(artist_past_venues),
-              "upcoming_shows_count": len(artist_upcoming_venues),
-            }
-  
+  data = venue_detail(venue_id)
+  if data is None:
+    abort(404)
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -254,7 +136,7 @@ def create_venue_submission():
     state = form.state.data
     address = form.address.data
     phone = form.phone.data
-    genres = form.genres.data
+    genres = Genre.named(form.genres.data)
     image_link = form.image_link.data
     facebook_link = form.facebook_link.data
     website_link = form.website_link.data
@@ -266,6 +148,8 @@ def create_venue_submission():
                     seeking_talent=seeking_talent, seeking_description=seeking_description)
     try:
       db.session.add(venue)
+      db.session.flush()
+      jobs.defer(warm_pages, pages_for(tags_for(venue, True)))
       db.session.commit()
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
@@ -288,73 +172,50 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@read_only
+@conditional(artists_freshness)
+@page_cache.cached(['artists'])
 def artists():
   # DONE: replace with real data returned from querying the database
-  artists = Artist.query.all()
+  page = artist_page(request.args.get('after'), request.args.get('before'), page_size(request.args.get('limit')),
+                     genre=request.args.get('genre'), state=request.args.get('state'))
   data = []
-  for artist in artists:
+  for artist in page['data']:
     data.append({
       'id': artist.id,
       'name': artist.name
     })
   
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, page=page)
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  return render_template('pages/search_artists.html', results=search_item(Artist, 1), search_term=search_item(Artist, 2))
+  search_term = request.form.get('search_term', '')
+  results = search_page(Artist, search_term, request.form.get('cursor'), page_size(request.form.get('limit')))
+  return render_template('pages/search_artists.html', results=results, search_term=search_term)
+
+@app.route('/artists/search.json')
+@read_only
+def search_artists_json():
+  search_term = request.args.get('search_term', '')
+  results = search_page(Artist, search_term, request.args.get('cursor'), page_size(request.args.get('limit')))
+  return jsonify(search_json(results))
 
 @app.route('/artists/<int:artist_id>')
+@read_only
+@conditional(artist_freshness)
+@page_cache.cached(lambda artist_id: ['artist', f'artist:{artist_id}'])
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   # DONE: replace with real artist data from the artist table, using artist_id
   
-  artist_past_shows = db.session.query(Show).filter(Show.start_time < datetime.now(), Show.artist_id == artist_id).join(Venue, Show.artist_id == Venue.id).add_columns(Venue.id, Venue.name, Venue.image_link, Show.start_time).all()
-
-  artist_upcoming_shows = db.session.query(Show).filter(Show.start_time > datetime.now(), Show.artist_id == artist_id).join(Venue, Show.artist_id == Venue.id).add_columns(Venue.id, Venue.name, Venue.image_link, Show.start_time).all()
-
-  artist_details = Artist.query.filter(Artist.id == artist_id).first()
-
-  past = []
-
-  upcomings = []
-
-  for show in artist_past_shows:
-    past.append({
-      "venue_id": show[1],
-      "venue_name": show[2],
-      "venue_image_link": show[3],
-      "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M"),
-    })
-
-  for upcoming in artist_upcoming_shows:
-      upcomings.append({
-      "venue_id": upcoming[1],
-      "venue_name": upcoming[2],
-      "venue_image_link": upcoming[3],
-      "start_time": upcoming.start_time.strftime("%m/%d/%Y, %H:%M"),
-      })
-
-  data = {
-              "id": artist_details.id,
-              "name": artist_details.name,
-              "genres": artist_details.genres,
-              "city": artist_details.city,
-              "state": artist_details.state,
-              "phone": artist_details.phone,
-              "website": artist_details.website_link,
-              "facebook_link": artist_details.facebook_link,
-              "seeking_venue": artist_details.seeking_venue,
-              "seeking_description": artist_details.seeking_description,
-              "image_link": artist_details.image_link,
-              "past_shows": past,
-              "upcoming_shows": upcomings,
-              "past_shows_count": len(artist_past_shows),
-              "upcoming_shows_count": len(artist_upcoming_shows),
-            }
+  data = artist_detail(artist_id)
+  if data is None:
+    abort(404)
   return render_template('pages/show_artist.html', artist=data)
 
 
@@ -432,7 +293,7 @@ def create_artist_submission():
     city = form.city.data
     state = form.state.data
     phone = form.phone.data
-    genres = form.genres.data
+    genres = Genre.named(form.genres.data)
     image_link = form.image_link.data
     facebook_link = form.facebook_link.data
     website_link = form.website_link.data
@@ -444,6 +305,8 @@ def create_artist_submission():
                     seeking_venue=seeking_venue, seeking_description=seeking_description)
     try:
       db.session.add(artist)
+      db.session.flush()
+      jobs.defer(warm_pages, pages_for(tags_for(artist, True)))
       db.session.commit()
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except:
@@ -458,27 +321,14 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@read_only
+@conditional(shows_freshness)
+@page_cache.cached(['shows'])
 def shows():
   # displays list of shows at /shows
   # DONE: replace with real venues data.
-  list_of_shows = Show.query.join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).all()
-  def get_list_of_shows(list_param):
-      shows = []
-      for show in list_param:
-        #Push multiple elements into an array
-        shows.append(
-          {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": str(show.start_time),
-          }
-        )
-      return shows
-  
-  return render_template('pages/shows.html', shows=get_list_of_shows(list_of_shows))
+  page = show_page(request.args.get('after'), request.args.get('before'), page_size(request.args.get('limit')))
+  return render_template('pages/shows.html', shows=page['data'], page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -496,12 +346,17 @@ def create_show_submission():
     artist_id = form.artist_id.data
     venue_id = form.venue_id.data
     start_time = form.start_time.data
+    end_time = form.end_time.data
   
-    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
     try:
       db.session.add(show)
+      jobs.defer(warm_pages, pages_for(tags_for(show, True)))
       db.session.commit()
       flash('Show was successfully listed!')
+    except BookingError as error:
+      db.session.rollback()
+      flash(f'Show could not be listed. {error}')
     except:
       print(sys.exc_info())
       db.session.rollback()
@@ -510,6 +365,122 @@ def create_show_submission():
       db.session.close()
   return render_template('pages/home.html')
 
+#  JSON API
+#  ----------------------------------------------------------------
+
+def api_response(build, *args):
+  try:
+    body = build(*args, request.args)
+  except ApiError as error:
+    return jsonify({"error": str(error)}), 400
+  if body is None:
+    return jsonify({"error": "not found"}), 404
+  return Response(body, mimetype='application/json')
+
+@app.route(f'/api/{API_VERSION}/venues')
+@read_only
+@conditional(venues_freshness)
+def api_venues():
+  # ?fields=id,name,...&genre=&state=&city=&after=&before=&limit=
+  return api_response(api_listing, 'venues')
+
+@app.route(f'/api/{API_VERSION}/venues/<int:venue_id>')
+@read_only
+@conditional(venue_freshness)
+def api_venue(venue_id):
+  return api_response(api_detail, 'venues', venue_id)
+
+@app.route(f'/api/{API_VERSION}/venues/<int:venue_id>/availability')
+@read_only
+@conditional(venue_freshness)
+def api_venue_availability(venue_id):
+  # ?from= (required)&to=&min_length= (minutes); the venue's free time between its shows.
+  return api_response(api_availability, venue_id)
+
+@app.route(f'/api/{API_VERSION}/artists')
+@read_only
+@conditional(artists_freshness)
+def api_artists():
+  # ?fields=id,name,...&genre=&state=&after=&before=&limit=
+  return api_response(api_listing, 'artists')
+
+@app.route(f'/api/{API_VERSION}/artists/<int:artist_id>')
+@read_only
+@conditional(artist_freshness)
+def api_artist(artist_id):
+  return api_response(api_detail, 'artists', artist_id)
+
+@app.route(f'/api/{API_VERSION}/shows')
+@read_only
+@conditional(shows_freshness)
+def api_shows():
+  # ?fields=id,start_time,...&venue_id=&artist_id=&when=upcoming|past&after=&before=&limit=
+  return api_response(api_listing, 'shows')
+
+@app.route(f'/api/{API_VERSION}/shows/schedule', methods=['POST'])
+def api_schedule_shows():
+  # {"venue_id", "artist_id", "slots": [...]} or
+  # {"venue_id", "artist_id", "start_time", "repeat": "daily"|"weekly", "interval", "count" | "until"}
+  # plus an optional "duration" in minutes.
+  spec = request.get_json(silent=True)
+  try:
+    ids = schedule_shows(spec)
+    db.session.commit()
+  except BookingConflict as error:
+    db.session.rollback()
+    return jsonify({"error": str(error), "conflict": error.as_dict()}), 409
+  except (ScheduleError, BookingError) as error:
+    db.session.rollback()
+    return jsonify({"error": str(error)}), 400
+  finally:
+    db.session.close()
+  # The insert bypassed the session, so the page cache hears about it here.
+  tags = ['shows', f'venue:{spec["venue_id"]}', f'artist:{spec["artist_id"]}']
+  page_cache.invalidate(tags)
+  jobs.enqueue(warm_pages, pages_for(tags))
+  return jsonify({"ids": ids}), 201
+
+#  Exports
+#  ----------------------------------------------------------------
+
+def export_arguments(args):
+  try:
+    after_id = int(args['after_id']) if args.get('after_id') else None
+    updated_since = datetime.fromisoformat(args['updated_since']) if args.get('updated_since') else None
+  except ValueError:
+    abort(400)
+  return after_id, updated_since
+
+@app.route('/export/<kind>.<fmt>')
+@read_only
+def export(kind, fmt):
+  # Streams a whole table; pass after_id or updated_since for incremental pulls.
+  if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+    abort(404)
+  after_id, updated_since = export_arguments(request.args)
+  try:
+    chunks = export_chunks(db.read_engine(), kind, fmt, after_id, updated_since)
+  except ExportError as error:
+    return jsonify({"error": str(error)}), 400
+  return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt],
+                  headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(page_cache.stats())
+
+@app.route('/jobs/stats')
+def job_stats():
+  return jsonify(jobs.stats())
+
+@app.route('/pool/stats')
+def database_pool_stats():
+  replicas = app.extensions['replicas']
+  return jsonify({
+    "primary": pool_stats(db.engine),
+    "replicas": [dict(replica.stats(), **pool_stats(replica.engine)) for replica in replicas.replicas],
+  })
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -518,6 +489,84 @@ def not_found_error(error):
 def server_error(error):
     return render_template('errors/500.html'), 500
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--copy/--no-copy', 'use_copy', default=True, show_default=True, help='Use COPY on Postgres.')
+def import_command(kind, path, fmt, batch_size, use_copy):
+  """Bulk-load venues, artists or shows from a CSV or JSONL file."""
+  def progress(importer, elapsed):
+    click.echo(f'{kind}: {importer.read} read, {importer.written} written, {importer.bad} bad, '
+               f'{importer.read / max(elapsed, 1e-9):,.0f} rows/s')
+
+  importer = Importer(kind, batch_size, use_copy)
+  importer.run(path, fmt, progress)
+  # Core inserts bypass the session events that normally evict cached pages.
+  page_cache.invalidate([kind, 'venue', 'artist'] if kind == 'shows' else [kind])
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson', show_default=True)
+@click.option('--after-id', type=int, help='Only rows with a larger id.')
+@click.option('--updated-since', type=click.DateTime(), help='Only rows modified after this time.')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Defaults to stdout.')
+def export_command(kind, fmt, after_id, updated_since, output):
+  """Stream a table out as NDJSON or CSV."""
+  try:
+    chunks = export_chunks(db.engine, kind, fmt, after_id, updated_since)
+  except ExportError as error:
+    raise click.ClickException(str(error))
+  for chunk in chunks:
+    output.write(chunk)
+
+@app.cli.command('check-plans')
+def check_plans_command():
+  """EXPLAIN every read route's queries and fail on a sequential scan of Show."""
+  check_plans(app)
+
+@app.cli.command('age-show-counters')
+@click.option('--recount', is_flag=True, help='Rebuild every counter from Show instead.')
+def age_show_counters_command(recount):
+  """Move shows that have started out of the upcoming-show counters."""
+  with db.engine.begin() as conn:
+    if recount:
+      recount_shows(conn)
+      click.echo('upcoming-show counters rebuilt')
+    else:
+      click.echo(f'{age_shows(conn)} shows aged out of the upcoming-show counters')
+
+@app.cli.command('partition-shows')
+@click.option('--ahead', default=12, show_default=True, help='Months of partitions to keep ready after this one.')
+@click.option('--keep', type=int, help='Detach partitions older than this many months.')
+@click.option('--drop', is_flag=True, help='Drop detached partitions instead of keeping them as archive tables.')
+def partition_shows_command(ahead, keep, drop):
+  """Create upcoming monthly Show partitions and archive old ones (Postgres)."""
+  try:
+    maintain_partitions(db.engine, ahead=ahead, keep=keep, drop=drop, report=click.echo)
+  except PartitionError as error:
+    raise click.ClickException(str(error))
+
+@app.cli.command('retry-dead-jobs')
+def retry_dead_jobs_command():
+  """List the dead-letter jobs in the SQLite job queue and queue them again."""
+  if app.config.get('JOB_QUEUE_BACKEND') != 'sqlite':
+    raise click.ClickException('Only the sqlite job queue outlives its process; see GET /jobs/stats instead')
+  for job in jobs.backend.dead_letters(100):
+    click.echo(f'#{job.id} {job.name}{json.loads(job.payload)} after {job.attempts} attempts: {job.error}')
+  click.echo(f'{jobs.backend.requeue_dead()} jobs queued again')
+
+@app.cli.command('build-assets')
+def build_assets_command():
+  """Bundle, fingerprint and gzip static/ into static/dist."""
+  manifest = build_assets(app.static_folder, report=lambda path, size: click.echo(f'{size:>10,}  {path}'))
+  click.echo(f'{len(manifest)} assets; restart the app to serve them.')
+
 
 if not app.debug:
     file_handler = FileHandler('error.log')
@@ -0,0 +1,230 @@
+import io
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import abort, jsonify, render_template, request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import app, jobs, page_cache
+from freshness import conditional, fetch_validators
+from models import Venue, Artist
+from pagination import page_size
+from queries import venue_detail, artist_detail, show_page
+from routing import replica_engine
+from search import search_page, search_json, similarity
+
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#----------------------------------------------------------------------------#
+
+# Serve with an ASGI server, e.g. `uvicorn asgi:application --workers 4`.
+# The read views below run on the event loop against an async engine, so one
+# worker overlaps many database waits. Every other route goes to the WSGI app
+# on a thread pool, unchanged. The views reuse the query layer through
+# AsyncSession.run_sync and keep the page cache and replica routing.
+
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+engines = {}
+
+
+def async_url(url):
+  url = make_url(url)
+  backend = url.get_backend_name()
+  if backend not in ASYNC_DRIVERS:
+    raise ValueError(f'no async driver configured for {backend}')
+  return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def async_engine_options(config, url):
+  # The sync pool settings, minus what only psycopg2 or QueuePool understand.
+  options = {key: value for key, value in config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).items()
+             if key not in ('poolclass', 'connect_args')}
+  if url.get_backend_name() == 'postgresql':
+    connect_args = {}
+    if config.get('DB_PGBOUNCER'):
+      # Transaction pooling hands server connections around, so asyncpg must
+      # not keep prepared statements; the timeout comes from pool.py's SET LOCAL.
+      connect_args['statement_cache_size'] = 0
+    elif config.get('DB_STATEMENT_TIMEOUT_MS'):
+      connect_args['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}
+    options['connect_args'] = connect_args
+  return options
+
+
+def register_similarity(dbapi_connection, connection_record):
+  # search.py only recognises plain sqlite3 connections.
+  dbapi_connection.create_function('similarity', 2, similarity, deterministic=True)
+
+
+def async_engine(url):
+  key = url.render_as_string(hide_password=False)
+  if key not in engines:
+    url = async_url(url)
+    engine = create_async_engine(url, **async_engine_options(app.config, url))
+    if engine.dialect.name == 'sqlite':
+      event.listen(engine.sync_engine, 'connect', register_similarity)
+    engines[key] = engine
+  return engines[key]
+
+
+async def run(fn, *args, **kwargs):
+  # Same routing as the sync session: a replica for read-only views outside
+  # the sticky window, otherwise the primary.
+  engine = replica_engine()
+  url = engine.url if engine is not None else make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+  async with AsyncSession(async_engine(url)) as session:
+    return await session.run_sync(lambda session: fn(*args, session=session, **kwargs))
+
+#----------------------------------------------------------------------------#
+# Async views.
+#----------------------------------------------------------------------------#
+
+views = {}
+
+
+def async_view(endpoint):
+  # Registers the async twin of a view in app.py, with the same page caching
+  # and conditional GET handling.
+  def decorator(view):
+    sync_view = app.view_functions[endpoint]
+    wrapped = view
+    if getattr(sync_view, 'cache_tags', None) is not None:
+      wrapped = page_cache.cached(sync_view.cache_tags)(wrapped)
+    if getattr(sync_view, 'freshness', None) is not None:
+      wrapped = conditional(sync_view.freshness, execute=lambda statement: run(fetch_validators, statement))(wrapped)
+    views[endpoint] = wrapped
+    return view
+  return decorator
+
+
+@async_view('show_venue')
+async def show_venue(venue_id):
+  data = await run(venue_detail, venue_id)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_venue.html', venue=data)
+
+
+@async_view('show_artist')
+async def show_artist(artist_id):
+  data = await run(artist_detail, artist_id)
+  if data is None:
+    abort(404)
+  return render_template('pages/show_artist.html', artist=data)
+
+
+@async_view('shows')
+async def shows():
+  page = await run(show_page, request.args.get('after'), request.args.get('before'), page_size(request.args.get('limit')))
+  return render_template('pages/shows.html', shows=page['data'], page=page)
+
+
+@async_view('search_venues')
+async def search_venues():
+  search_term = request.form.get('search_term', '')
+  results = await run(search_page, Venue, search_term, request.form.get('cursor'), page_size(request.form.get('limit')))
+  return render_template('pages/search_venues.html', results=results, search_term=search_term)
+
+
+@async_view('search_artists')
+async def search_artists():
+  search_term = request.form.get('search_term', '')
+  results = await run(search_page, Artist, search_term, request.form.get('cursor'), page_size(request.form.get('limit')))
+  return render_template('pages/search_artists.html', results=results, search_term=search_term)
+
+
+@async_view('search_venues_json')
+async def search_venues_json():
+  search_term = request.args.get('search_term', '')
+  results = await run(search_page, Venue, search_term, request.args.get('cursor'), page_size(request.args.get('limit')))
+  return jsonify(search_json(results))
+
+
+@async_view('search_artists_json')
+async def search_artists_json():
+  search_term = request.args.get('search_term', '')
+  results = await run(search_page, Artist, search_term, request.args.get('cursor'), page_size(request.args.get('limit')))
+  return jsonify(search_json(results))
+
+#----------------------------------------------------------------------------#
+# Dispatch.
+#----------------------------------------------------------------------------#
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+  # asgiref runs every WSGI call on one shared thread by default; use the pool.
+  run_wsgi_app = sync_to_async(vars(WsgiToAsgiInstance)['run_wsgi_app'].func, thread_sensitive=False)
+
+
+def match(scope):
+  path = scope['path']
+  root_path = scope.get('root_path', '')
+  if root_path and path.startswith(root_path):
+    path = path[len(root_path):]
+  try:
+    endpoint, _ = app.url_map.bind('', script_name=root_path or None).match(path, scope['method'])
+  except HTTPException:
+    return None
+  return views.get(endpoint)
+
+
+def build_environ(scope, body):
+  instance = WsgiToAsgiInstance(app)
+  instance.scope = scope
+  return instance.build_environ(scope, body)
+
+
+async def dispatch(view, scope, receive, send):
+  body = io.BytesIO()
+  while True:
+    message = await receive()
+    body.write(message.get('body', b''))
+    if not message.get('more_body'):
+      break
+  body.seek(0)
+
+  # The same request lifecycle as Flask.full_dispatch_request, with the view awaited in place.
+  with app.request_context(build_environ(scope, body)):
+    try:
+      try:
+        rv = app.preprocess_request()
+        if rv is None:
+          rv = await view(**request.view_args)
+      except Exception as error:
+        rv = app.handle_user_exception(error)
+      response = app.finalize_request(rv)
+    except Exception as error:
+      response = app.make_response(app.handle_exception(error))
+    data = b'' if scope['method'] == 'HEAD' else response.get_data()
+
+  await send({
+    'type': 'http.response.start',
+    'status': response.status_code,
+    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.to_wsgi_list()],
+  })
+  await send({'type': 'http.response.body', 'body': data})
+
+
+async def lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message['type'] == 'lifespan.startup':
+      await send({'type': 'lifespan.startup.complete'})
+    elif message['type'] == 'lifespan.shutdown':
+      await sync_to_async(jobs.shutdown, thread_sensitive=False)()
+      for engine in engines.values():
+        await engine.dispose()
+      await send({'type': 'lifespan.shutdown.complete'})
+      return
+
+
+async def application(scope, receive, send):
+  if scope['type'] == 'lifespan':
+    return await lifespan(receive, send)
+  view = match(scope) if scope['type'] == 'http' else None
+  if view is None:
+    return await ThreadedWsgiInstance(app)(scope, receive, send)
+  await dispatch(view, scope, receive, send)
@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+#----------------------------------------------------------------------------#
+# Static asset pipeline.
+#----------------------------------------------------------------------------#
+
+# `flask build-assets` writes the bundles below, and a copy of every other
+# file under static/, into static/dist with a content hash in each name plus a
+# gzip sibling for the compressible ones, and records them in a manifest.
+# Templates link through asset_url()/asset_urls(), which return the hashed URLs
+# once a build exists and the source files otherwise. A hashed file never
+# changes, so it is served as immutable with a one-year expiry and browsers
+# stop asking for it.
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# Concatenated in order; each list replaces that run of tags in layouts/main.html.
+BUNDLES = {
+  'css/site.css': [
+    'css/bootstrap.min.css',
+    'css/layout.main.css',
+    'css/main.css',
+    'css/main.responsive.css',
+    'css/main.quickfix.css',
+  ],
+  'js/head.js': [
+    'js/libs/modernizr-2.8.2.min.js',
+    'js/libs/moment.min.js',
+  ],
+  # Deferred: runs after jQuery, in the order the separate tags ran.
+  'js/site.js': [
+    'js/script.js',
+    'js/libs/bootstrap-3.1.1.min.js',
+    'js/plugins.js',
+  ],
+}
+
+# Worth gzipping; images and woff are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.eot', '.ttf', '.otf', '.json', '.txt')
+
+MAX_AGE = 365 * 24 * 3600
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def fingerprint(path, data):
+  root, ext = posixpath.splitext(path)
+  return f'{root}.{hashlib.sha1(data).hexdigest()[:10]}{ext}'
+
+
+def rewrite_css_urls(css, source, target, manifest):
+  # Points url() references at the hashed copies, relative to where the CSS
+  # now lives. References to missing files, data: URIs and absolute URLs stay.
+  def replace(match):
+    quote, reference = match.groups()
+    path, sep, suffix = re.match(r'([^?#]*)([?#]?)(.*)', reference).groups()
+    if ':' in path or path.startswith('/'):
+      return match.group(0)
+    resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+    if resolved not in manifest:
+      return match.group(0)
+    relative = posixpath.relpath(manifest[resolved], posixpath.dirname(target))
+    return f'url({quote}{relative}{sep}{suffix}{quote})'
+  return CSS_URL.sub(replace, css)
+
+
+def source_files(static_folder):
+  for root, dirs, files in os.walk(static_folder):
+    if os.path.samefile(root, static_folder):
+      dirs[:] = [name for name in dirs if name != BUILD_DIR]
+    dirs.sort()
+    for name in sorted(files):
+      yield os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+
+
+def read_source(static_folder, path):
+  with open(os.path.join(static_folder, path), 'rb') as handle:
+    return handle.read()
+
+
+def write_asset(output, path, data):
+  target = os.path.join(output, path)
+  os.makedirs(os.path.dirname(target), exist_ok=True)
+  if not os.path.exists(target):
+    with open(target, 'wb') as handle:
+      handle.write(data)
+  written = [(path, len(data))]
+  if path.endswith(COMPRESSIBLE):
+    # mtime=0 keeps the bytes, and so any ETag derived from them, reproducible.
+    compressed = gzip.compress(data, 9, mtime=0)
+    if len(compressed) < len(data):
+      with open(target + '.gz', 'wb') as handle:
+        handle.write(compressed)
+      written.append((path + '.gz', len(compressed)))
+  return written
+
+
+def build(static_folder, report=None):
+  # Returns the manifest. Earlier builds' files are kept, so pages rendered
+  # (or cached) before a deploy still find their assets.
+  output = os.path.join(static_folder, BUILD_DIR)
+  manifest, written = {}, []
+
+  # CSS last, so its url() references can point at the hashed files.
+  sources = sorted(source_files(static_folder), key=lambda path: path.endswith('.css'))
+  for path in sources:
+    data = read_source(static_folder, path)
+    if path.endswith('.css'):
+      data = rewrite_css_urls(data.decode('utf-8'), path, path, manifest).encode('utf-8')
+    manifest[path] = fingerprint(path, data)
+    written += write_asset(output, manifest[path], data)
+
+  for name, parts in BUNDLES.items():
+    chunks = []
+    for path in parts:
+      text = read_source(static_folder, path).decode('utf-8')
+      if name.endswith('.css'):
+        text = rewrite_css_urls(text, path, name, manifest)
+      chunks.append(text)
+    # A newline and semicolon keep a file without a trailing one from merging into the next.
+    data = ('\n' if name.endswith('.css') else '\n;\n').join(chunks).encode('utf-8')
+    manifest[name] = fingerprint(name, data)
+    written += write_asset(output, manifest[name], data)
+
+  with open(os.path.join(output, MANIFEST), 'w') as handle:
+    json.dump(manifest, handle, indent=2, sort_keys=True)
+  if report:
+    for path, size in written:
+      report(path, size)
+  return manifest
+
+
+def load_manifest(static_folder):
+  try:
+    with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as handle:
+      return json.load(handle)
+  except FileNotFoundError:
+    return {}
+
+# ---------------------------------------------------------------------------#
+# Template helpers and serving
+# ---------------------------------------------------------------------------#
+
+def asset_url(path):
+  hashed = current_app.extensions['assets'].get(path)
+  if hashed is None:
+    return url_for('static', filename=path)
+  return url_for('asset', filename=hashed)
+
+
+def asset_urls(name):
+  # One URL for a built bundle; its source files, in order, before a build.
+  if name in current_app.extensions['assets']:
+    return [asset_url(name)]
+  return [asset_url(path) for path in BUNDLES.get(name, [name])]
+
+
+def serve_asset(filename):
+  directory = os.path.join(current_app.static_folder, BUILD_DIR)
+  compressed = filename + '.gz'
+  encoded = 'gzip' in request.accept_encodings and os.path.isfile(safe_join(directory, compressed) or '')
+  response = send_from_directory(directory, compressed if encoded else filename,
+                                 mimetype=mimetypes.guess_type(filename)[0], max_age=MAX_AGE)
+  if encoded:
+    response.content_encoding = 'gzip'
+  response.vary.add('Accept-Encoding')
+  response.cache_control.public = True
+  response.cache_control.immutable = True
+  response.expires = datetime.now(timezone.utc) + timedelta(seconds=MAX_AGE)
+  return response
+
+
+def init_app(app):
+  app.extensions['assets'] = load_manifest(app.static_folder)
+  app.add_url_rule(f'{app.static_url_path}/{BUILD_DIR}/<path:filename>', endpoint='asset', view_func=serve_asset)
+  app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
@@ -0,0 +1,194 @@
+from datetime import timedelta
+from functools import lru_cache
+from itertools import groupby
+
+from sqlalchemy import and_, bindparam, event, inspect, or_, select, text
+from sqlalchemy.orm import Session
+
+from intervals import IntervalTree
+from models import Venue, Show, SHOW_LENGTH, MAX_SHOW_LENGTH
+
+#----------------------------------------------------------------------------#
+# Venue availability and double-booking checks.
+#----------------------------------------------------------------------------#
+
+# No two shows at one venue may overlap. On Postgres every Show partition has
+# an exclusion constraint over (venue, time range), backed by a GiST index.
+# Exclusion constraints cannot span partitions, though, and SQLite has none.
+# So every write is also checked here:
+#
+#   1. the venue rows are locked, so bookings at one venue take turns;
+#   2. the venues' nearby shows are fetched in one query per 200 venues and
+#      loaded into an interval tree per venue;
+#   3. each new booking is matched against the tree.
+#
+# No show runs longer than MAX_SHOW_LENGTH. The shows that can overlap
+# [start, end) therefore all start in [start - MAX_SHOW_LENGTH, end), which is
+# a range scan of ix_Show_venue_id_start_time on both databases.
+
+
+# Keeps the OR of venue windows, and its bound parameters, a modest size.
+WINDOWS_PER_QUERY = 200
+
+
+class BookingError(ValueError):
+  pass
+
+
+class BookingConflict(BookingError):
+
+  def __init__(self, venue_id, start_time, end_time, show_id=None):
+    # show_id: the booked show in the way, or None for a clash within the batch.
+    self.venue_id, self.start_time, self.end_time, self.show_id = venue_id, start_time, end_time, show_id
+    # venue_id is None for a venue added in the same flush.
+    taken = f'show {show_id}' if show_id is not None else 'another show in this booking'
+    venue = f'Venue {venue_id}' if venue_id is not None else 'The new venue'
+    super().__init__(f'{venue} is already booked from {start_time:%Y-%m-%d %H:%M} '
+                     f'to {end_time:%Y-%m-%d %H:%M} ({taken})')
+
+  def as_dict(self):
+    return {"venue_id": self.venue_id, "start_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat(), "show_id": self.show_id}
+
+
+def lock_venues(conn, venue_ids):
+  # Held until the transaction ends.
+  if conn.dialect.name == 'sqlite':
+    # SQLite locks the whole database for writing, and any write takes the lock.
+    conn.execute(text('UPDATE "Venue" SET id = id WHERE id = :id'), {'id': min(venue_ids)})
+    return
+  # NO KEY UPDATE leaves inserts of the venue's shows (FOR KEY SHARE) unblocked.
+  conn.execute(select(Venue.id).where(Venue.id.in_(sorted(venue_ids))).order_by(Venue.id)
+               .with_for_update(key_share=True))
+
+
+@lru_cache(maxsize=None)
+def window_statement(size):
+  # An OR of `size` bounded venue windows; built, and compiled, once per size.
+  return select(Show.venue_id, Show.start_time, Show.end_time, Show.id).where(or_(*(
+    and_(Show.venue_id == bindparam(f'venue_{index}'), Show.start_time > bindparam(f'earliest_{index}'),
+         Show.start_time < bindparam(f'end_{index}'), Show.end_time > bindparam(f'start_{index}'))
+    for index in range(size)
+  )), Show.id.not_in(bindparam('exclude', expanding=True))).order_by(Show.start_time, Show.id)
+
+
+def booked(conn, windows, exclude=()):
+  # The shows overlapping windows ({venue_id: (start, end)}) as (venue_id,
+  # start_time, end_time, id), in start order, leaving out the ids in exclude.
+  windows, rows = sorted(windows.items()), []
+  for offset in range(0, len(windows), WINDOWS_PER_QUERY):
+    chunk = windows[offset:offset + WINDOWS_PER_QUERY]
+    # Padded to a power of two with repeats, so only a few statement shapes exist.
+    size = min(1 << (len(chunk) - 1).bit_length(), WINDOWS_PER_QUERY)
+    chunk += chunk[-1:] * (size - len(chunk))
+    params = {'exclude': list(exclude)}
+    for index, (venue_id, (start, end)) in enumerate(chunk):
+      params.update({f'venue_{index}': venue_id, f'earliest_{index}': start - MAX_SHOW_LENGTH,
+                     f'start_{index}': start, f'end_{index}': end})
+    rows.extend(conn.execute(window_statement(size), params).all())
+  return rows
+
+
+def check_length(start_time, end_time):
+  if end_time <= start_time:
+    raise BookingError(f'A show must end after it starts ({start_time:%Y-%m-%d %H:%M})')
+  if end_time - start_time > MAX_SHOW_LENGTH:
+    raise BookingError(f'A show may last at most {MAX_SHOW_LENGTH // timedelta(hours=1)} hours ({start_time:%Y-%m-%d %H:%M})')
+
+
+def check_bookings(conn, bookings, exclude=()):
+  # bookings: (venue_id, start_time, end_time) for the shows about to be
+  # written; exclude: ids of the shows they replace or delete. Raises
+  # BookingError, or BookingConflict at the first overlap.
+  bookings = sorted((int(venue_id), start_time, end_time) for venue_id, start_time, end_time in bookings)
+  if not bookings:
+    return
+  for _, start_time, end_time in bookings:
+    check_length(start_time, end_time)
+  groups = {venue_id: list(group) for venue_id, group in groupby(bookings, key=lambda booking: booking[0])}
+  lock_venues(conn, groups)
+  existing = {venue_id: [] for venue_id in groups}
+  windows = {venue_id: (group[0][1], max(end_time for _, _, end_time in group)) for venue_id, group in groups.items()}
+  for venue_id, start_time, end_time, id in booked(conn, windows, exclude):
+    existing[venue_id].append((start_time, end_time, id))
+  for venue_id, group in groups.items():
+    check_group(venue_id, group, IntervalTree(existing[venue_id]))
+
+
+def check_group(venue_id, group, tree):
+  # group: one venue's bookings, sorted by start; tree: its booked shows.
+  latest = None
+  for _, start_time, end_time in group:
+    clashes = tree.overlapping(start_time, end_time)
+    if clashes:
+      raise BookingConflict(venue_id, *clashes[0])
+    # Sorted by start, a booking clashes with the batch only if it starts
+    # before the latest end so far.
+    if latest is not None and start_time < latest[1]:
+      raise BookingConflict(venue_id, *latest)
+    if latest is None or end_time > latest[1]:
+      latest = (start_time, end_time)
+
+
+def changed(obj, attrs):
+  state = inspect(obj)
+  return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def show_venue(show):
+  # (venue_id, venue) for a show. A show given its venue through the
+  # relationship has no venue_id until the flush copies it across, and a venue
+  # added in the same flush has no id yet either.
+  if show.venue_id is not None and not inspect(show).attrs['venue'].history.has_changes():
+    return show.venue_id, None
+  venue = show.venue
+  if venue is None:
+    raise BookingError('A show needs a venue')
+  return venue.id, venue
+
+
+@event.listens_for(Session, 'before_flush')
+def check_flushed_shows(session, flush_context, instances):
+  # Before the flush, so a conflict stops it before any row is written.
+  bookings, replaced, unsaved = [], [], {}
+  def book(show):
+    venue_id, venue = show_venue(show)
+    if venue_id is not None:
+      bookings.append((venue_id, show.start_time, show.end_time))
+    else:
+      unsaved.setdefault(venue, []).append((None, show.start_time, show.end_time))
+  for obj in session.new:
+    if isinstance(obj, Show) and obj.start_time is not None:
+      if obj.end_time is None:
+        obj.end_time = obj.start_time + SHOW_LENGTH
+      book(obj)
+  for obj in session.dirty:
+    if isinstance(obj, Show) and changed(obj, ('venue_id', 'venue', 'start_time', 'end_time')):
+      book(obj)
+      replaced.append(obj.id)
+  for obj in session.deleted:
+    if isinstance(obj, Show):
+      replaced.append(obj.id)
+  if bookings:
+    check_bookings(session.connection(), bookings, replaced)
+  # A venue not yet written has no shows to clash with, or to lock, besides
+  # the ones booked with it.
+  for group in unsaved.values():
+    for _, start_time, end_time in group:
+      check_length(start_time, end_time)
+    check_group(None, sorted(group, key=lambda booking: booking[1]), IntervalTree([]))
+
+
+def free_slots(conn, venue_id, start, end, min_length=None):
+  # The gaps between the venue's shows within [start, end), as (start, end)
+  # pairs, keeping those at least min_length long.
+  slots, cursor = [], start
+  for _, show_start, show_end, _ in booked(conn, {venue_id: (start, end)}):
+    if show_start > cursor:
+      slots.append((cursor, show_start))
+    cursor = max(cursor, show_end)
+  if end > cursor:
+    slots.append((cursor, end))
+  if min_length:
+    slots = [(slot_start, slot_end) for slot_start, slot_end in slots if slot_end - slot_start >= min_length]
+  return slots
@@ -0,0 +1,79 @@
+"""Cost of encoding JSON API pages.
+
+Compares building a dict per row for json.dumps (the jsonify path) with the
+per-field row encoders in api.py, on rows shaped like the venue and show
+listings, for all fields and for a sparse fieldset.
+
+    python -m benchmarks.bench_api [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import api
+
+
+def venue_row(rng, id):
+  return (id, f'Venue {id}', 'Jazz|Rock n Roll', f'{id} Main Street', 'San Francisco', 'CA', '555-0100',
+          f'https://venue{id}.example.com', f'https://www.facebook.com/venue{id}', rng.random() < 0.5, None,
+          f'https://images.example.com/venues/{id}.jpg', datetime(2026, 1, 1) + timedelta(seconds=id), id)
+
+
+def show_row(rng, id):
+  start = datetime(2026, 1, 1, 20) + timedelta(minutes=30 * id)
+  return (id, start, start + timedelta(hours=2), rng.randint(1, 1000), f'Venue {id % 1000}', f'https://images.example.com/venues/{id}.jpg',
+          rng.randint(1, 500), f'Artist {id % 500}', None, start, id)
+
+
+def dict_encoder(kind, names):
+  # What jsonify(data=[dict(...) for row in rows]) costs: a dict per row and
+  # json.dumps walking it, with datetimes and genres converted on the way.
+  def encode(rows):
+    data = []
+    for row in rows:
+      record = dict(zip(names, row))
+      if 'genres' in record:
+        record['genres'] = api.split_genres(record['genres'])
+      for key, value in record.items():
+        if isinstance(value, datetime):
+          record[key] = value.isoformat()
+      data.append(record)
+    return json.dumps(data, separators=(',', ':'))[1:-1]
+  return encode
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rows', type=int, default=10000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  rng = random.Random(1)
+  samples = {
+    'venues': [venue_row(rng, id) for id in range(1, args.rows + 1)],
+    'shows': [show_row(rng, id) for id in range(1, args.rows + 1)],
+  }
+  fieldsets = [
+    ('venues', tuple(api.RESOURCES['venues'].fields)),
+    ('venues', ('id', 'name')),
+    ('shows', tuple(api.RESOURCES['shows'].fields)),
+  ]
+
+  print(f'{args.rows} rows, best of {args.repeat}')
+  for kind, names in fieldsets:
+    # Sparse rows carry only the selected columns, then the sort key.
+    keys = len(api.RESOURCES[kind].keys)
+    positions = [list(api.RESOURCES[kind].fields).index(name) for name in names]
+    rows = [tuple(row[i] for i in positions) + row[-keys:] for row in samples[kind]]
+    encoder, baseline = api.row_encoder(kind, names), dict_encoder(kind, names)
+    assert json.loads(f'[{encoder(rows)}]') == json.loads(f'[{baseline(rows)}]')
+    label = f'{kind}?fields={",".join(names)}' if len(names) < len(api.RESOURCES[kind].fields) else kind
+    for name, encode in (('dict + json.dumps', baseline), ('field encoders', encoder)):
+      best = min(timeit.repeat(lambda: encode(rows), number=1, repeat=args.repeat))
+      print(f'{label:<24}{name:<20}{best * 1000:>10.1f} ms{args.rows / best:>12.0f} rows/s')
+
+
+if __name__ == '__main__':
+  main()
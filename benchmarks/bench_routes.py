@@ -0,0 +1,265 @@
+"""p50/p99 latency, query count and peak memory of every route in app.py.
+
+Seeds a catalogue with benchmarks.generate, drives each route through the
+Flask test client and compares the results with a stored baseline. Exits
+non-zero when a route regresses or a route in app.py has no benchmark case.
+
+    python -m benchmarks.bench_routes [--venues 2000] [--artists 1000] [--shows 20000]
+                                      [--requests 50] [--rounds 3] [--baseline PATH] [--save-baseline]
+
+Set DATABASE_URL and pass --no-seed to benchmark an existing (migrated,
+seeded) database instead of a fresh SQLite file. The page cache is off
+unless --page-cache is given, so every request renders.
+"""
+import argparse
+import gc
+import importlib
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Routes that are benchmarked elsewhere or cannot be: endpoint -> reason.
+SKIPPED = {
+  'static': 'served by the web server in production',
+  'asset': 'served by the web server in production',
+  'delete_venue': 'not implemented yet',
+}
+
+
+def cases(ids):
+  # (name, endpoint, method, path, form data, expected status)
+  venue, artist = ids['venue'], ids['artist']
+  # Bookings move on a day per request: a repeat would be a double booking.
+  days = itertools.count()
+  show = lambda: {'venue_id': venue, 'artist_id': artist,
+                  'start_time': (datetime(2030, 1, 1, 20) + timedelta(days=next(days))).strftime('%Y-%m-%d %H:%M:%S')}
+  weeks = itertools.count()
+  schedule = lambda: json.dumps({'venue_id': venue, 'artist_id': artist, 'repeat': 'weekly', 'count': 12,
+                                 'start_time': (datetime(2040, 1, 1, 20) + timedelta(weeks=12 * next(weeks))).isoformat()})
+  venue_form = {'name': 'Bench Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street', 'genres': 'Jazz',
+                'facebook_link': 'https://www.facebook.com/bench'}
+  artist_form = {'name': 'Bench Artist', 'city': 'Austin', 'state': 'TX', 'genres': 'Jazz',
+                 'facebook_link': 'https://www.facebook.com/bench'}
+  return [
+    ('home', 'index', 'GET', '/', None, 200),
+    ('venues', 'venues', 'GET', '/venues', None, 200),
+    ('venues?genre', 'venues', 'GET', '/venues?genre=Jazz&state=NY', None, 200),
+    ('venue', 'show_venue', 'GET', f'/venues/{venue}', None, 200),
+    ('venue search', 'search_venues', 'POST', '/venues/search', {'search_term': 'hall'}, 200),
+    ('venue search.json', 'search_venues_json', 'GET', '/venues/search.json?search_term=golden+crown', None, 200),
+    ('venue form', 'create_venue_form', 'GET', '/venues/create', None, 200),
+    ('venue create', 'create_venue_submission', 'POST', '/venues/create', venue_form, 200),
+    ('venue edit form', 'edit_venue', 'GET', f'/venues/{venue}/edit', None, 200),
+    ('venue edit', 'edit_venue_submission', 'POST', f'/venues/{venue}/edit', venue_form, 302),
+    ('artists', 'artists', 'GET', '/artists', None, 200),
+    ('artists?genre', 'artists', 'GET', '/artists?genre=Rock+n+Roll&state=CA', None, 200),
+    ('artist', 'show_artist', 'GET', f'/artists/{artist}', None, 200),
+    ('artist search', 'search_artists', 'POST', '/artists/search', {'search_term': 'band'}, 200),
+    ('artist search.json', 'search_artists_json', 'GET', '/artists/search.json?search_term=neon+wolf', None, 200),
+    ('artist form', 'create_artist_form', 'GET', '/artists/create', None, 200),
+    ('artist create', 'create_artist_submission', 'POST', '/artists/create', artist_form, 200),
+    ('artist edit form', 'edit_artist', 'GET', f'/artists/{artist}/edit', None, 200),
+    ('artist edit', 'edit_artist_submission', 'POST', f'/artists/{artist}/edit', artist_form, 302),
+    ('shows', 'shows', 'GET', '/shows', None, 200),
+    ('show form', 'create_shows', 'GET', '/shows/create', None, 200),
+    ('show create', 'create_show_submission', 'POST', '/shows/create', show, 200),
+    ('show schedule', 'api_schedule_shows', 'POST', '/api/v1/shows/schedule', schedule, 201),
+    ('api venues', 'api_venues', 'GET', '/api/v1/venues?limit=100', None, 200),
+    ('api venues?fields', 'api_venues', 'GET', '/api/v1/venues?fields=id,name&limit=100', None, 200),
+    ('api venue', 'api_venue', 'GET', f'/api/v1/venues/{venue}', None, 200),
+    ('api availability', 'api_venue_availability', 'GET',
+     f'/api/v1/venues/{venue}/availability?from={datetime.now():%Y-%m-%dT%H:00}&min_length=60', None, 200),
+    ('api artists', 'api_artists', 'GET', '/api/v1/artists?limit=100', None, 200),
+    ('api artist', 'api_artist', 'GET', f'/api/v1/artists/{artist}', None, 200),
+    ('api shows', 'api_shows', 'GET', '/api/v1/shows?limit=100', None, 200),
+    ('api shows?fields', 'api_shows', 'GET', f'/api/v1/shows?fields=id,start_time&venue_id={venue}', None, 200),
+    ('export venues', 'export', 'GET', f'/export/venues.ndjson?after_id={ids["last_venue"] - 500}', None, 200),
+    ('export shows', 'export', 'GET', f'/export/shows.csv?after_id={ids["last_show"] - 500}', None, 200),
+    ('cache stats', 'cache_stats', 'GET', '/cache/stats', None, 200),
+    ('pool stats', 'database_pool_stats', 'GET', '/pool/stats', None, 200),
+    ('job stats', 'job_stats', 'GET', '/jobs/stats', None, 200),
+  ]
+
+
+def uncovered(app, covered):
+  endpoints = {rule.endpoint for rule in app.url_map.iter_rules()}
+  return sorted(endpoints - set(covered) - set(SKIPPED))
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class QueryCounter:
+
+  def __init__(self):
+    self.count = 0
+    event.listen(Engine, 'before_cursor_execute', self)
+
+  def __call__(self, *args):
+    self.count += 1
+
+
+def request(client, method, path, data):
+  # Form fields come as a dict, JSON bodies as a string, or either from a
+  # callable that makes a fresh one per request.
+  if callable(data):
+    data = data()
+  content_type = 'application/json' if isinstance(data, str) else None
+  response = client.open(path, method=method, data=data, content_type=content_type)
+  response.get_data()  # drains streamed responses
+  return response
+
+
+def measure(client, counter, case, requests, warmup, rounds):
+  name, endpoint, method, path, data, status = case
+  for _ in range(warmup):
+    response = request(client, method, path, data)
+    if response.status_code != status:
+      raise SystemExit(f'{name}: expected {status}, got {response.status_code} from {method} {path}')
+
+  # Best of several rounds, like timeit: filters out a noisy neighbour, not a slow route.
+  p50s, p99s, queries = [], [], []
+  for _ in range(rounds):
+    gc.collect()
+    timings = []
+    for _ in range(requests):
+      counter.count = 0
+      started = time.perf_counter()
+      request(client, method, path, data)
+      timings.append(time.perf_counter() - started)
+      queries.append(counter.count)
+    p50s.append(statistics.median(timings))
+    p99s.append(percentile(timings, 0.99))
+
+  # Memory is traced on a separate request: tracing slows everything down.
+  gc.collect()
+  tracemalloc.start()
+  request(client, method, path, data)
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return {
+    "p50_ms": round(min(p50s) * 1000, 3),
+    "p99_ms": round(min(p99s) * 1000, 3),
+    "queries": max(queries),
+    "peak_kib": round(peak / 1024, 1),
+  }
+
+
+def regressions(results, baseline, tolerances):
+  # Latency must also grow by more than a millisecond: sub-millisecond routes are mostly noise.
+  found = []
+  for name, result in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if result['queries'] > before['queries']:
+      found.append(f'{name}: {result["queries"]} queries, baseline {before["queries"]}')
+    for key in ('p50_ms', 'p99_ms'):
+      if result[key] > before[key] * (1 + tolerances[key]) and result[key] - before[key] > 1:
+        found.append(f'{name}: {key} {result[key]:.2f}, baseline {before[key]:.2f}')
+    if result['peak_kib'] > before['peak_kib'] * (1 + tolerances['peak_kib']):
+      found.append(f'{name}: peak {result["peak_kib"]:.0f} KiB, baseline {before["peak_kib"]:.0f} KiB')
+  return found
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=2000)
+  parser.add_argument('--artists', type=int, default=1000)
+  parser.add_argument('--shows', type=int, default=20000)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--no-seed', dest='seed_data', action='store_false', help='Use the data already in DATABASE_URL.')
+  parser.add_argument('--requests', type=int, default=50, help='Timed requests per route.')
+  parser.add_argument('--rounds', type=int, default=3, help='Rounds per route; the best one counts.')
+  parser.add_argument('--warmup', type=int, default=3)
+  parser.add_argument('--page-cache', action='store_true', help='Leave the page cache on.')
+  parser.add_argument('--baseline', default=BASELINE)
+  parser.add_argument('--save-baseline', action='store_true')
+  parser.add_argument('--p50-tolerance', type=float, default=0.25, help='Allowed p50 slowdown, as a fraction.')
+  parser.add_argument('--p99-tolerance', type=float, default=1.0, help='Allowed p99 slowdown, as a fraction.')
+  parser.add_argument('--memory-tolerance', type=float, default=0.25, help='Allowed peak memory growth, as a fraction.')
+  args = parser.parse_args()
+
+  path = None
+  if args.seed_data and 'DATABASE_URL' not in os.environ:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+  if not args.page_cache:
+    os.environ['PAGE_CACHE_BACKEND'] = 'none'
+
+  # config.py reads the environment at import time.
+  app = importlib.import_module('app').app
+  app.config.update(WTF_CSRF_ENABLED=False)
+  from models import db, Venue, Artist, Show
+  from benchmarks.generate import generate
+
+  try:
+    with app.app_context():
+      if args.seed_data:
+        db.create_all()
+        generate(db.engine, args.venues, args.artists, args.shows, args.seed)
+      with db.engine.connect() as conn:
+        ids = {
+          # The busiest venue and artist have the largest detail pages.
+          "venue": conn.execute(select(Show.venue_id).group_by(Show.venue_id)
+                                .order_by(func.count().desc()).limit(1)).scalar(),
+          "artist": conn.execute(select(Show.artist_id).group_by(Show.artist_id)
+                                 .order_by(func.count().desc()).limit(1)).scalar(),
+          "last_venue": conn.execute(select(func.max(Venue.id))).scalar(),
+          "last_show": conn.execute(select(func.max(Show.id))).scalar(),
+        }
+      db.session.remove()
+
+    routes = cases(ids)
+    missing = uncovered(app, [case[1] for case in routes])
+    counter = QueryCounter()
+    client = app.test_client()
+    results = {}
+    print(f'{"route":<20}{"p50 ms":>10}{"p99 ms":>10}{"queries":>9}{"peak KiB":>10}')
+    for case in routes:
+      result = results[case[0]] = measure(client, counter, case, args.requests, args.warmup, args.rounds)
+      print(f'{case[0]:<20}{result["p50_ms"]:>10.2f}{result["p99_ms"]:>10.2f}{result["queries"]:>9}{result["peak_kib"]:>10.0f}')
+
+    scale = {"venues": args.venues, "artists": args.artists, "shows": args.shows, "seed": args.seed}
+    if args.save_baseline:
+      with open(args.baseline, 'w') as handle:
+        json.dump({"scale": scale, "routes": results}, handle, indent=2, sort_keys=True)
+      print(f'baseline written to {args.baseline}')
+    elif not os.path.exists(args.baseline):
+      print(f'no baseline at {args.baseline}; run with --save-baseline to record one')
+    else:
+      with open(args.baseline) as handle:
+        baseline = json.load(handle)
+      if args.seed_data and baseline['scale'] != scale:
+        raise SystemExit(f'baseline was recorded at {baseline["scale"]}, not {scale}')
+      tolerances = {"p50_ms": args.p50_tolerance, "p99_ms": args.p99_tolerance, "peak_kib": args.memory_tolerance}
+      found = regressions(results, baseline['routes'], tolerances)
+      for line in found:
+        print(f'REGRESSION {line}')
+      if found:
+        sys.exit(1)
+      print('no regressions against baseline')
+
+    if missing:
+      raise SystemExit(f'routes without a benchmark case: {", ".join(missing)}')
+  finally:
+    if path:
+      os.remove(path)
+
+
+if __name__ == '__main__':
+  main()
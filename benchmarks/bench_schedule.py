@@ -0,0 +1,101 @@
+"""Cost of booking a run of shows: one form post per show vs one schedule.
+
+Books the same weekly residency through POST /shows/create once per show (the
+per-row path: a flush and a commit each) and through one POST to
+/api/v1/shows/schedule (one multi-row INSERT in one transaction), and reports
+wall time and statements for each.
+
+    python -m benchmarks.bench_schedule [--shows 1,12,52,365] [--repeat 5]
+
+Set DATABASE_URL to benchmark an existing (migrated, seeded) database instead
+of a fresh SQLite file.
+"""
+import argparse
+import importlib
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+
+class StatementCounter:
+
+  def __init__(self):
+    self.count = 0
+    event.listen(Engine, 'before_cursor_execute', self)
+
+  def __call__(self, *args):
+    self.count += 1
+
+
+def per_row(client, venue_id, artist_id, start, count):
+  for index in range(count):
+    start_time = start + timedelta(weeks=index)
+    response = client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                                   'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
+    assert response.status_code == 200
+
+
+def scheduled(client, venue_id, artist_id, start, count):
+  response = client.post('/api/v1/shows/schedule', json={'venue_id': venue_id, 'artist_id': artist_id,
+                                                         'start_time': start.isoformat(), 'repeat': 'weekly',
+                                                         'count': count})
+  assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', default='1,12,52,365', help='Comma-separated run lengths.')
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  path = None
+  if 'DATABASE_URL' not in os.environ:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+  # Only the write path is timed: no page cache to evict or re-render.
+  os.environ['PAGE_CACHE_BACKEND'] = 'none'
+  os.environ['JOB_QUEUE_BACKEND'] = 'none'
+
+  # config.py reads the environment at import time.
+  app = importlib.import_module('app').app
+  app.config.update(WTF_CSRF_ENABLED=False)
+  from models import db, Venue, Artist
+  from benchmarks.generate import generate
+
+  try:
+    with app.app_context():
+      if path:
+        db.create_all()
+        generate(db.engine, 200, 100, 2000, 1)
+      with db.engine.connect() as conn:
+        venue_id = conn.execute(select(func.min(Venue.id))).scalar()
+        artist_id = conn.execute(select(func.min(Artist.id))).scalar()
+
+    client = app.test_client()
+    counter = StatementCounter()
+    start = datetime(2031, 1, 2, 21)
+    print(f'{"shows":>6}  {"path":<22}{"total":>10}{"per show":>12}{"statements":>12}')
+    for count in [int(value) for value in args.shows.split(',')]:
+      for name, book in (('form post per show', per_row), ('one schedule', scheduled)):
+        best = None
+        for _ in range(args.repeat):
+          counter.count = 0
+          started = time.perf_counter()
+          book(client, venue_id, artist_id, start, count)
+          elapsed = time.perf_counter() - started
+          # Every run books weeks no other run has, or it would double-book the venue.
+          start += timedelta(weeks=count)
+          best = elapsed if best is None else min(best, elapsed)
+        print(f'{count:>6}  {name:<22}{best * 1000:>8.1f} ms{best * 1000 / count:>9.2f} ms{counter.count:>12}')
+  finally:
+    if path:
+      os.remove(path)
+
+
+if __name__ == '__main__':
+  main()
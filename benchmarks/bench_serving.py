@@ -0,0 +1,178 @@
+"""Throughput of gunicorn sync workers against uvicorn serving asgi.py.
+
+Starts each server in turn with the same number of worker processes, then
+drives the read views (detail pages, shows, searches) from many client
+threads for a fixed time and reports requests/sec with p50/p99 latency.
+
+    python -m benchmarks.bench_serving [--workers 4] [--concurrency 64] [--duration 10]
+                                       [--venues 2000] [--artists 1000] [--shows 20000]
+
+Without DATABASE_URL a catalogue is seeded into a temporary SQLite file,
+where queries never wait on the network and the async path has little to
+overlap. Point DATABASE_URL at a seeded Postgres (with --no-seed) to see the
+difference one worker's event loop makes. The page cache is off for both.
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import func, select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def servers(workers, port):
+  return [
+    ('gunicorn sync', ['gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'app:app']),
+    ('uvicorn asgi', ['uvicorn', 'asgi:application', '--workers', str(workers), '--host', '127.0.0.1',
+                      '--port', str(port), '--log-level', 'warning', '--no-access-log']),
+  ]
+
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+def wait_until_up(port, process, timeout=30):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if process.poll() is not None:
+      raise SystemExit(f'server exited with {process.returncode}')
+    try:
+      conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+      conn.request('GET', '/')
+      conn.getresponse().read()
+      return
+    except OSError:
+      time.sleep(0.2)
+  raise SystemExit(f'server on port {port} did not come up')
+
+
+def paths(ids, count, seed=1):
+  # A fixed, shuffled mix of the views asgi.py serves asynchronously.
+  rng = random.Random(seed)
+  terms = ['hall', 'golden+crown', 'band', 'neon', 'the+wild', 'lounge']
+  makers = [
+    lambda: f'/venues/{rng.randint(1, ids["venues"])}',
+    lambda: f'/artists/{rng.randint(1, ids["artists"])}',
+    lambda: '/shows',
+    lambda: f'/venues/search.json?search_term={rng.choice(terms)}',
+    lambda: f'/artists/search.json?search_term={rng.choice(terms)}',
+  ]
+  return [rng.choice(makers)() for _ in range(count)]
+
+
+def load(port, mix, concurrency, duration):
+  latencies, errors = [], [0]
+  lock = threading.Lock()
+  stop = time.monotonic() + duration
+
+  def client(offset):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    mine, failed, index = [], 0, offset
+    while time.monotonic() < stop:
+      path = mix[index % len(mix)]
+      index += 1
+      started = time.perf_counter()
+      try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        if response.status >= 500:
+          failed += 1
+        # gunicorn's sync workers close the connection after every response.
+        if response.will_close:
+          conn.close()
+      except (OSError, http.client.HTTPException):
+        failed += 1
+        conn.close()
+        continue
+      mine.append(time.perf_counter() - started)
+    with lock:
+      latencies.extend(mine)
+      errors[0] += failed
+
+  threads = [threading.Thread(target=client, args=(i * 97,)) for i in range(concurrency)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+  latencies.sort()
+  return {
+    "requests": len(latencies),
+    "rps": len(latencies) / elapsed,
+    "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+    "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000 if latencies else 0.0,
+    "errors": errors[0],
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--workers', type=int, default=4)
+  parser.add_argument('--concurrency', type=int, default=64)
+  parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server.')
+  parser.add_argument('--venues', type=int, default=2000)
+  parser.add_argument('--artists', type=int, default=1000)
+  parser.add_argument('--shows', type=int, default=20000)
+  parser.add_argument('--no-seed', dest='seed_data', action='store_false', help='Use the data already in DATABASE_URL.')
+  args = parser.parse_args()
+
+  from models import db, Venue, Artist
+  from benchmarks.generate import generate
+
+  path = None
+  database_uri = os.environ.get('DATABASE_URL')
+  if not database_uri:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database_uri = f'sqlite:///{path}'
+
+  app = Flask(__name__)
+  app.config.update(SQLALCHEMY_DATABASE_URI=database_uri, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+  db.init_app(app)
+  try:
+    with app.app_context():
+      if args.seed_data:
+        db.create_all()
+        generate(db.engine, args.venues, args.artists, args.shows)
+      with db.engine.connect() as conn:
+        ids = {"venues": conn.execute(select(func.max(Venue.id))).scalar(),
+               "artists": conn.execute(select(func.max(Artist.id))).scalar()}
+      db.engine.dispose()
+
+    mix = paths(ids, 10000)
+    env = dict(os.environ, DATABASE_URL=database_uri, PAGE_CACHE_BACKEND='none')
+    print(f'{args.workers} workers, {args.concurrency} clients, {args.duration:.0f}s per server')
+    print(f'{"server":<16}{"requests":>10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for name, command in servers(args.workers, free_port()):
+      port = int(command[command.index('--port') + 1]) if '--port' in command else int(command[command.index('--bind') + 1].rsplit(':', 1)[1])
+      process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+      try:
+        wait_until_up(port, process)
+        load(port, mix, min(args.concurrency, 8), 1)  # warm up each worker
+        result = load(port, mix, args.concurrency, args.duration)
+      finally:
+        process.terminate()
+        process.wait()
+      print(f'{name:<16}{result["requests"]:>10}{result["rps"]:>10.0f}{result["p50_ms"]:>10.1f}'
+            f'{result["p99_ms"]:>10.1f}{result["errors"]:>8}')
+  finally:
+    if path:
+      os.remove(path)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,96 @@
+"""Rows/sec and peak memory of the /shows read path.
+
+Compares the original ORM path (joined Show entities, lazy-loaded venue and
+artist, one dict per row) with the projection-only path in queries.py.
+
+    python -m benchmarks.bench_shows [--shows 100000] [--database-uri URI]
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from models import db, Venue, Artist, Show
+from queries import fetch_show_rows, show_rows_select
+
+
+def seed(num_shows, num_venues=1000, num_artists=1000):
+  start = datetime(2020, 1, 1)
+  db.session.execute(Venue.__table__.insert(), [
+    {"name": f"Venue {i}", "city": "San Francisco", "state": "CA", "seeking_talent": False}
+    for i in range(1, num_venues + 1)])
+  db.session.execute(Artist.__table__.insert(), [
+    {"name": f"Artist {i}", "image_link": f"https://example.com/artists/{i}.jpg", "seeking_venue": False}
+    for i in range(1, num_artists + 1)])
+  db.session.execute(Show.__table__.insert(), [
+    {"venue_id": i % num_venues + 1, "artist_id": (i * 7) % num_artists + 1, "start_time": start + timedelta(hours=i)}
+    for i in range(num_shows)])
+  db.session.commit()
+
+
+def orm_path():
+  list_of_shows = Show.query.join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id) \
+    .order_by(Show.start_time, Show.id).all()
+  return [{
+    "venue_id": show.venue_id,
+    "venue_name": show.venue.name,
+    "artist_id": show.artist_id,
+    "artist_name": show.artist.name,
+    "artist_image_link": show.artist.image_link,
+    "start_time": str(show.start_time),
+  } for show in list_of_shows]
+
+
+def projection_path():
+  return fetch_show_rows(show_rows_select().order_by(Show.start_time, Show.id))
+
+
+def measure(fn):
+  db.session.expunge_all()
+  gc.collect()
+  tracemalloc.start()
+  started = time.perf_counter()
+  rows = fn()
+  elapsed = time.perf_counter() - started
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  db.session.rollback()
+  return len(rows), elapsed, peak
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', type=int, default=100000)
+  parser.add_argument('--database-uri', default=os.environ.get('BENCH_DATABASE_URI'))
+  args = parser.parse_args()
+
+  path = None
+  if not args.database_uri:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    args.database_uri = f'sqlite:///{path}'
+
+  app = Flask(__name__)
+  app.config.update(SQLALCHEMY_DATABASE_URI=args.database_uri, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+  db.init_app(app)
+  try:
+    with app.app_context():
+      db.create_all()
+      seed(args.shows)
+      print(f'{"path":<12}{"rows":>10}{"seconds":>10}{"rows/sec":>12}{"peak MiB":>10}')
+      for name, fn in (('orm', orm_path), ('projection', projection_path)):
+        count, elapsed, peak = measure(fn)
+        print(f'{name:<12}{count:>10}{elapsed:>10.2f}{count / elapsed:>12.0f}{peak / 2 ** 20:>10.1f}')
+      db.drop_all()
+  finally:
+    if path:
+      os.remove(path)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,199 @@
+"""Seeded catalogue generator for benchmarks and plan checks.
+
+Builds venues, artists and shows at any scale. Cities, genres and show
+bookings follow Zipf-like distributions, so a few big cities, popular genres
+and busy venues dominate the way they do in real listings. The same seed
+always produces the same catalogue.
+
+    python -m benchmarks.generate [--venues 100000] [--artists 50000] [--shows 2000000]
+                                  [--seed 1] [--database-uri URI]
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import select
+
+from counters import recount
+from forms import VenueForm
+from importer import reserve_ids
+from models import db, Genre, Venue, Artist, Show, venue_genres, artist_genres
+
+CITIES = [
+  ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Nashville', 'TN'), ('Austin', 'TX'),
+  ('San Francisco', 'CA'), ('Seattle', 'WA'), ('New Orleans', 'LA'), ('Atlanta', 'GA'), ('Denver', 'CO'),
+  ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Portland', 'OR'), ('Miami', 'FL'), ('Detroit', 'MI'),
+  ('Minneapolis', 'MN'), ('Houston', 'TX'), ('Las Vegas', 'NV'), ('Memphis', 'TN'), ('San Diego', 'CA'),
+  ('Kansas City', 'MO'), ('Baltimore', 'MD'), ('Pittsburgh', 'PA'), ('Cleveland', 'OH'), ('Phoenix', 'AZ'),
+  ('Salt Lake City', 'UT'), ('Raleigh', 'NC'), ('Omaha', 'NE'), ('Albuquerque', 'NM'), ('Boise', 'ID'),
+]
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+
+VENUE_WORDS = (['The', 'Old', 'Blue', 'Golden', 'Velvet', 'Electric', 'Red', 'Silver', 'Little', 'Grand'],
+               ['Musical', 'Lantern', 'Anchor', 'Owl', 'Crown', 'Echo', 'Harbor', 'Fox', 'Lotus', 'Rail'],
+               ['Hall', 'Room', 'Lounge', 'Theatre', 'Tavern', 'Club', 'Ballroom', 'Cellar', 'Garden', 'Bar'])
+ARTIST_WORDS = (['Wild', 'Quiet', 'Neon', 'Midnight', 'Broken', 'Paper', 'Lucky', 'Iron', 'Sunny', 'Hollow'],
+                ['Sax', 'Petal', 'River', 'Wolf', 'Crow', 'Piano', 'Comet', 'Harbor', 'Lily', 'Drum'],
+                ['Band', 'Trio', 'Collective', 'Orchestra', 'Quartet', 'Kids', 'Project', 'Club', 'Sound', 'Choir'])
+
+BATCH_SIZE = 10000
+
+SLOT_LENGTH = timedelta(minutes=30)
+SLOTS = 2 * 17520
+
+
+def zipf_weights(count, skew):
+  # Cumulative weights for random.choices; rank 1 is the most popular.
+  return list(itertools.accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def batches(total, size=BATCH_SIZE):
+  for start in range(0, total, size):
+    yield min(size, total - start)
+
+
+class Generator:
+
+  def __init__(self, seed=1, skew=1.0, now=None):
+    self.random = random.Random(seed)
+    self.skew = skew
+    self.now = now or datetime.now().replace(second=0, microsecond=0)
+    self.city_weights = zipf_weights(len(CITIES), skew)
+    self.genre_weights = zipf_weights(len(GENRES), skew)
+    # (venue id, slot) pairs already booked, so no venue is double-booked.
+    self.booked = set()
+
+  def name(self, words, number):
+    # Repeated word combinations make realistic search hits; the number keeps names distinct.
+    return ' '.join(self.random.choice(choices) for choices in words) + f' {number}'
+
+  def genres(self):
+    picked = self.random.choices(GENRES, cum_weights=self.genre_weights, k=self.random.randint(1, 3))
+    return list(dict.fromkeys(picked))
+
+  def venue(self, id):
+    city, state = self.random.choices(CITIES, cum_weights=self.city_weights)[0]
+    return {
+      "id": id,
+      "name": self.name(VENUE_WORDS, id),
+      "city": city,
+      "state": state,
+      "address": f'{self.random.randint(1, 9999)} Main Street',
+      "phone": f'{self.random.randint(200, 999)}-555-{self.random.randint(0, 9999):04d}',
+      "image_link": f'https://example.com/venues/{id}.jpg',
+      "website_link": f'https://example.com/venues/{id}',
+      "seeking_talent": self.random.random() < 0.3,
+      "seeking_description": None,
+    }
+
+  def artist(self, id):
+    city, state = self.random.choices(CITIES, cum_weights=self.city_weights)[0]
+    return {
+      "id": id,
+      "name": self.name(ARTIST_WORDS, id),
+      "city": city,
+      "state": state,
+      "phone": f'{self.random.randint(200, 999)}-555-{self.random.randint(0, 9999):04d}',
+      "image_link": f'https://example.com/artists/{id}.jpg',
+      "seeking_venue": self.random.random() < 0.3,
+      "seeking_description": None,
+    }
+
+  def slot(self, venue_ids, venue_weights):
+    # A free half-hour slot; a taken one is drawn again, venue and all. Each
+    # venue has SLOTS slots, which bounds the shows one catalogue can book.
+    while True:
+      venue_id = self.random.choices(venue_ids, cum_weights=venue_weights)[0]
+      slot = self.random.randint(-SLOTS // 2, SLOTS // 2)
+      if (venue_id, slot) not in self.booked:
+        self.booked.add((venue_id, slot))
+        return venue_id, slot
+
+  def shows(self, venue_ids, artist_ids, count, venue_weights, artist_weights):
+    # Half-hour shows spanning a year either side of now, on the hour or half hour.
+    artists = self.random.choices(artist_ids, cum_weights=artist_weights, k=count)
+    rows = []
+    for artist_id in artists:
+      venue_id, slot = self.slot(venue_ids, venue_weights)
+      start_time = self.now + SLOT_LENGTH * slot
+      rows.append({"venue_id": venue_id, "artist_id": artist_id,
+                   "start_time": start_time, "end_time": start_time + SLOT_LENGTH})
+    return rows
+
+
+def genre_ids(conn):
+  existing = {row.name: row.id for row in conn.execute(select(Genre.id, Genre.name))}
+  for name in GENRES:
+    if name not in existing:
+      existing[name] = conn.execute(Genre.__table__.insert().values(name=name)).inserted_primary_key[0]
+  return existing
+
+
+def insert_owners(engine, table, link_table, link_column, total, build, generator, genres, report):
+  ids = []
+  for size in batches(total):
+    with engine.begin() as conn:
+      rows = [build(id) for id in reserve_ids(conn, table, size)]
+      links = [{link_column: row['id'], 'genre_id': genres[name]} for row in rows for name in generator.genres()]
+      conn.execute(table.insert(), rows)
+      conn.execute(link_table.insert(), links)
+    ids.extend(row['id'] for row in rows)
+    report(table.name, len(ids), total)
+  return ids
+
+
+def generate(engine, venues=100000, artists=50000, shows=2000000, seed=1, skew=1.0, report=None):
+  # Appends a catalogue to whatever the database already holds; returns the new ids.
+  report = report or (lambda table, done, total: None)
+  generator = Generator(seed, skew)
+  with engine.begin() as conn:
+    genres = genre_ids(conn)
+  venue_ids = insert_owners(engine, Venue.__table__, venue_genres, 'venue_id', venues, generator.venue,
+                            generator, genres, report)
+  artist_ids = insert_owners(engine, Artist.__table__, artist_genres, 'artist_id', artists, generator.artist,
+                             generator, genres, report)
+  if venue_ids and artist_ids:
+    # Bookings are skewed too, but flatter than cities: busy venues, not one venue.
+    venue_weights = zipf_weights(len(venue_ids), skew * 0.6)
+    artist_weights = zipf_weights(len(artist_ids), skew * 0.4)
+    done = 0
+    for size in batches(shows):
+      with engine.begin() as conn:
+        conn.execute(Show.__table__.insert(), generator.shows(venue_ids, artist_ids, size, venue_weights, artist_weights))
+      done += size
+      report(Show.__table__.name, done, shows)
+    # One set-based rebuild beats adjusting the counters batch by batch.
+    with engine.begin() as conn:
+      recount(conn)
+  return {"venues": venue_ids, "artists": artist_ids}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=100000)
+  parser.add_argument('--artists', type=int, default=50000)
+  parser.add_argument('--shows', type=int, default=2000000)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent; 0 is uniform.')
+  parser.add_argument('--database-uri', default=os.environ.get('DATABASE_URL'), required=not os.environ.get('DATABASE_URL'))
+  args = parser.parse_args()
+
+  app = Flask(__name__)
+  app.config.update(SQLALCHEMY_DATABASE_URI=args.database_uri, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+  db.init_app(app)
+  started = time.perf_counter()
+
+  def report(table, done, total):
+    print(f'{table}: {done}/{total} ({time.perf_counter() - started:.1f}s)', flush=True)
+
+  with app.app_context():
+    db.create_all()
+    generate(db.engine, args.venues, args.artists, args.shows, args.seed, args.skew, report)
+
+
+if __name__ == '__main__':
+  main()
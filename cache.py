@@ -0,0 +1,319 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, g, make_response, request, session as flask_session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from jobs import task
+from models import Venue, Artist, Show
+from routing import STICKY_COOKIE
+
+#----------------------------------------------------------------------------#
+# Rendered-page cache.
+#----------------------------------------------------------------------------#
+
+# Entries hold a rendered body and are tagged with what they show
+# ("venues", "venue:7", "shows", ...). Commits evict exactly the tags the
+# flushed rows touch, and TTL plus a size bound cap everything else.
+
+
+class MemoryBackend:
+  # Per-process LRU.
+
+  def __init__(self, max_entries):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.tags = {}
+    self.lock = threading.Lock()
+    self.evictions = 0
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      value, expires_at, tags = entry
+      if expires_at <= time.time():
+        self._remove(key)
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl, tags):
+    with self.lock:
+      self._remove(key)
+      self.entries[key] = (value, time.time() + ttl, tags)
+      for tag in tags:
+        self.tags.setdefault(tag, set()).add(key)
+      while len(self.entries) > self.max_entries:
+        self._remove(next(iter(self.entries)))
+        self.evictions += 1
+
+  def invalidate(self, tags):
+    with self.lock:
+      for tag in tags:
+        for key in list(self.tags.get(tag, ())):
+          self._remove(key)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.tags.clear()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def _remove(self, key):
+    entry = self.entries.pop(key, None)
+    if entry is None:
+      return
+    for tag in entry[2]:
+      keys = self.tags.get(tag)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self.tags[tag]
+
+
+class SQLiteBackend:
+  # Shared by every worker on the host that points at the same file.
+
+  def __init__(self, path, max_entries):
+    self.path = path
+    self.max_entries = max_entries
+    self.local = threading.local()
+    self.evictions = 0
+    with self.connection() as conn:
+      conn.executescript('''
+        CREATE TABLE IF NOT EXISTS entries (
+          key TEXT PRIMARY KEY, body BLOB, mimetype TEXT, expires_at REAL, accessed_at REAL);
+        CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at);
+        CREATE TABLE IF NOT EXISTS entry_tags (tag TEXT, key TEXT);
+        CREATE INDEX IF NOT EXISTS ix_entry_tags_tag ON entry_tags (tag);
+        CREATE INDEX IF NOT EXISTS ix_entry_tags_key ON entry_tags (key);
+      ''')
+
+  def connection(self):
+    conn = getattr(self.local, 'conn', None)
+    if conn is None:
+      conn = self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+      conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+  def get(self, key):
+    conn = self.connection()
+    now = time.time()
+    row = conn.execute('SELECT body, mimetype FROM entries WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+    if row is None:
+      return None
+    conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+    return bytes(row[0]), row[1]
+
+  def set(self, key, value, ttl, tags):
+    body, mimetype = value
+    now = time.time()
+    conn = self.connection()
+    with conn:
+      conn.execute('BEGIN IMMEDIATE')
+      conn.execute('DELETE FROM entry_tags WHERE key = ?', (key,))
+      conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', (key, body, mimetype, now + ttl, now))
+      conn.executemany('INSERT INTO entry_tags VALUES (?, ?)', [(tag, key) for tag in tags])
+      conn.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+      overflow = conn.execute('SELECT count(*) FROM entries').fetchone()[0] - self.max_entries
+      if overflow > 0:
+        conn.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)', (overflow,))
+        self.evictions += overflow
+      conn.execute('DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)')
+
+  def invalidate(self, tags):
+    tags = list(tags)
+    marks = ', '.join('?' * len(tags))
+    conn = self.connection()
+    with conn:
+      conn.execute('BEGIN IMMEDIATE')
+      conn.execute(f'DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag IN ({marks}))', tags)
+      conn.execute(f'DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)')
+
+  def clear(self):
+    conn = self.connection()
+    with conn:
+      conn.execute('DELETE FROM entries')
+      conn.execute('DELETE FROM entry_tags')
+
+  def __len__(self):
+    return self.connection().execute('SELECT count(*) FROM entries').fetchone()[0]
+
+
+def tags_for(obj, is_new):
+  # What a flushed row appears on.
+  if isinstance(obj, Show):
+    tags = {'shows'}
+    state = inspect(obj)
+    for attr, prefix in (('venue_id', 'venue'), ('artist_id', 'artist')):
+      history = state.attrs[attr].history
+      for value in (getattr(obj, attr),) + tuple(history.deleted or ()):
+        if value is not None:
+          tags.add(f'{prefix}:{value}')
+    return tags
+  if isinstance(obj, Venue):
+    tags = {'venues', f'venue:{obj.id}'}
+    # An edited venue's name also appears on the shows list and artist pages.
+    return tags if is_new else tags | {'shows', 'artist'}
+  if isinstance(obj, Artist):
+    tags = {'artists', f'artist:{obj.id}'}
+    return tags if is_new else tags | {'shows', 'venue'}
+  return set()
+
+
+# The page behind each tag, for warming. The bare "venue" and "artist" tags
+# stand for every detail page and are left for readers to re-render.
+TAG_PAGES = {'venues': '/venues', 'artists': '/artists', 'shows': '/shows'}
+ENTITY_PAGES = {'venue': '/venues/{}', 'artist': '/artists/{}'}
+
+
+def pages_for(tags):
+  # The paths of the pages that evicting `tags` empties.
+  paths = []
+  for tag in sorted(tags):
+    prefix, _, id = tag.partition(':')
+    if id:
+      paths.append(ENTITY_PAGES[prefix].format(id))
+    elif tag in TAG_PAGES:
+      paths.append(TAG_PAGES[tag])
+  return paths
+
+
+class PageCache:
+
+  def __init__(self, app=None):
+    self.backend = None
+    self.ttl = 300
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+    self.generation = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    kind = app.config.get('PAGE_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('PAGE_CACHE_MAX_ENTRIES', 1024)
+    self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+    if kind == 'memory':
+      self.backend = MemoryBackend(max_entries)
+    elif kind == 'sqlite':
+      self.backend = SQLiteBackend(app.config.get('PAGE_CACHE_PATH', 'page_cache.db'), max_entries)
+    elif kind not in (None, '', 'none'):
+      raise ValueError(f'Unknown PAGE_CACHE_BACKEND {kind!r}')
+
+    event.listen(Session, 'after_flush', self.collect_tags)
+    event.listen(Session, 'after_commit', self.evict_committed)
+    event.listen(Session, 'after_soft_rollback', self.discard_tags)
+    app.extensions['page_cache'] = self
+
+  def collect_tags(self, session, flush_context):
+    tags = session.info.setdefault('page_cache_tags', set())
+    for obj in session.new:
+      tags |= tags_for(obj, True)
+    for obj in session.dirty | session.deleted:
+      tags |= tags_for(obj, False)
+
+  def evict_committed(self, session):
+    tags = session.info.pop('page_cache_tags', None)
+    if tags:
+      self.invalidate(tags)
+
+  def discard_tags(self, session, previous_transaction):
+    session.info.pop('page_cache_tags', None)
+
+  def invalidate(self, tags):
+    # Also the entry point for writes that bypass the ORM session (bulk Core inserts).
+    self.generation += 1
+    self.invalidations += 1
+    if self.backend is not None:
+      self.backend.invalidate(tags)
+
+  def cached(self, tags):
+    # tags: the view's tag list, or a callable taking the view's URL arguments.
+    # Works on plain and async views alike.
+    def decorator(view):
+      if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(**kwargs):
+          if not self.cacheable():
+            return await view(**kwargs)
+          hit = self.lookup()
+          if hit is not None:
+            return hit
+          generation = self.generation
+          return self.store(make_response(await view(**kwargs)), generation, tags, kwargs)
+        async_wrapper.cache_tags = tags
+        return async_wrapper
+
+      @wraps(view)
+      def wrapper(**kwargs):
+        if not self.cacheable():
+          return view(**kwargs)
+        hit = self.lookup()
+        if hit is not None:
+          return hit
+        generation = self.generation
+        return self.store(make_response(view(**kwargs)), generation, tags, kwargs)
+      wrapper.cache_tags = tags
+      return wrapper
+    return decorator
+
+  def cacheable(self):
+    # Pending flashes are rendered into the page, so those hits go uncached.
+    return self.backend is not None and request.method == 'GET' and not flask_session.get('_flashes')
+
+  def key(self):
+    # Under conditional(), the ETag is part of the key. A show that starts
+    # changes the ETag without a write to evict the page, and the new
+    # validators must not be served with the body rendered under the old ones.
+    return f'{request.endpoint}:{request.full_path}:{g.get("etag", "")}'
+
+  def lookup(self):
+    entry = self.backend.get(self.key())
+    if entry is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    body, mimetype = entry
+    return Response(body, mimetype=mimetype, headers={'X-Cache': 'HIT'})
+
+  def store(self, response, generation, tags, kwargs):
+    # Skip storing if a commit invalidated anything while this page rendered.
+    if response.status_code == 200 and not response.direct_passthrough and generation == self.generation:
+      entry_tags = tags(**kwargs) if callable(tags) else tags
+      self.backend.set(self.key(), (response.get_data(), response.mimetype), self.ttl, entry_tags)
+    response.headers['X-Cache'] = 'MISS'
+    return response
+
+  def stats(self):
+    return {
+      "backend": type(self.backend).__name__ if self.backend else None,
+      "entries": len(self.backend) if self.backend else 0,
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": self.backend.evictions if self.backend else 0,
+      "invalidations": self.invalidations,
+    }
+
+
+@task
+def warm_pages(paths):
+  # Renders pages a commit evicted, so the next reader gets a hit. The
+  # requests read from the primary: a replica may not have the write yet.
+  page_cache = current_app.extensions.get('page_cache')
+  if page_cache is None or page_cache.backend is None:
+    return
+  client = current_app.test_client()
+  client.set_cookie('localhost', STICKY_COOKIE, f'{time.time() + 60:.3f}')
+  for path in paths:
+    client.get(path)
@@ -0,0 +1,142 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Venue, Artist, Show, Watermark
+
+#----------------------------------------------------------------------------#
+# Upcoming-show counters.
+#----------------------------------------------------------------------------#
+
+# Venue.num_upcoming_shows and Artist.num_upcoming_shows count the shows
+# starting after the 'upcoming_shows' watermark. Every write that adds, moves
+# or removes a show adjusts them in its own transaction, and the aging job
+# (`flask age-show-counters`) subtracts the shows that have started and moves
+# the watermark up to now. Between runs, readers subtract the few shows that
+# started after the watermark (upcoming_counts), so the counts are exact and
+# the job only bounds how much there is to subtract.
+#
+# Writers read the watermark with FOR SHARE and the job takes it FOR UPDATE,
+# so a write never counts against a watermark that is moving under it.
+
+WATERMARK = 'upcoming_shows'
+
+OWNERS = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+
+def watermark(conn, for_update=False):
+  statement = select(Watermark.value).where(Watermark.name == WATERMARK)
+  return conn.execute(statement.with_for_update(read=not for_update)).scalar_one()
+
+
+def watermark_value():
+  # For use inside a read query.
+  return select(Watermark.value).where(Watermark.name == WATERMARK).scalar_subquery()
+
+
+def adjust(conn, model, deltas):
+  # deltas: {id: change}. Ids are sorted so concurrent writers lock rows in
+  # the same order. updated_at is kept: the counter is derived data.
+  deltas = sorted((id, delta) for id, delta in deltas.items() if id is not None and delta)
+  if not deltas:
+    return
+  table = model.__table__
+  statement = table.update().where(table.c.id == bindparam('owner_id')).values(
+    num_upcoming_shows=table.c.num_upcoming_shows + bindparam('delta'),
+    updated_at=table.c.updated_at,
+  )
+  conn.execute(statement, [{'owner_id': id, 'delta': delta} for id, delta in deltas])
+
+
+def count_shows(conn, changes):
+  # changes: (venue_id, artist_id, start_time, +1 or -1) for each show added
+  # or removed. Only shows after the watermark are counted.
+  changes = list(changes)
+  if not changes:
+    return
+  since = watermark(conn)
+  deltas = {Venue: Counter(), Artist: Counter()}
+  for venue_id, artist_id, start_time, sign in changes:
+    if start_time is not None and start_time > since:
+      deltas[Venue][venue_id] += sign
+      deltas[Artist][artist_id] += sign
+  for model, _ in OWNERS:
+    adjust(conn, model, deltas[model])
+
+
+def count_inserted_shows(conn, rows):
+  # For Core inserts of show rows (dicts), which skip the flush hook.
+  count_shows(conn, ((row['venue_id'], row['artist_id'], row['start_time'], 1) for row in rows))
+
+
+def previous(obj, attr):
+  history = inspect(obj).attrs[attr].history
+  values = history.deleted or history.unchanged
+  return values[0] if values else getattr(obj, attr)
+
+
+@event.listens_for(Session, 'after_flush')
+def count_flushed_shows(session, flush_context):
+  # After the flush, so new shows have their ids and defaults; the session's
+  # new/dirty/deleted collections and attribute history still describe it.
+  changes = []
+  for obj in session.new:
+    if isinstance(obj, Show):
+      changes.append((obj.venue_id, obj.artist_id, obj.start_time, 1))
+  for obj in session.deleted:
+    if isinstance(obj, Show):
+      changes.append((previous(obj, 'venue_id'), previous(obj, 'artist_id'), previous(obj, 'start_time'), -1))
+  for obj in session.dirty:
+    if isinstance(obj, Show) and session.is_modified(obj):
+      changes.append((previous(obj, 'venue_id'), previous(obj, 'artist_id'), previous(obj, 'start_time'), -1))
+      changes.append((obj.venue_id, obj.artist_id, obj.start_time, 1))
+  count_shows(session, changes)
+
+# ---------------------------------------------------------------------------#
+# Reading and aging
+# ---------------------------------------------------------------------------#
+
+def upcoming_counts(model, now):
+  # (subquery, count expression): join the subquery on <model>.id to read the
+  # exact upcoming count, i.e. the counter minus the shows that started since
+  # the watermark. That is a range scan of ix_Show_start_time_id.
+  owner_column = getattr(Show, dict(OWNERS)[model])
+  started = select(owner_column.label('owner_id'), func.count(Show.id).label('started')) \
+    .where(Show.start_time > watermark_value(), Show.start_time <= now) \
+    .group_by(owner_column) \
+    .subquery()
+  return started, (model.num_upcoming_shows - func.coalesce(started.c.started, 0))
+
+
+def age(conn, now=None):
+  # Subtracts the shows that started since the watermark and moves it to now.
+  # Returns how many shows aged out.
+  now = now or datetime.now()
+  since = watermark(conn, for_update=True)
+  if now <= since:
+    return 0
+  window = and_(Show.start_time > since, Show.start_time <= now)
+  for model, column in OWNERS:
+    table, owner_column = model.__table__, getattr(Show, column)
+    started = select(func.count(Show.id)).where(owner_column == table.c.id, window).scalar_subquery()
+    conn.execute(table.update()
+                 .where(table.c.id.in_(select(owner_column).where(window)))
+                 .values(num_upcoming_shows=table.c.num_upcoming_shows - started, updated_at=table.c.updated_at))
+  aged = conn.execute(select(func.count(Show.id)).where(window)).scalar()
+  conn.execute(Watermark.__table__.update().where(Watermark.name == WATERMARK).values(value=now))
+  return aged
+
+
+def recount(conn, now=None):
+  # Rebuilds every counter from Show: for repairs and Core bulk loads.
+  now = now or datetime.now()
+  if conn.execute(select(Watermark.name).where(Watermark.name == WATERMARK).with_for_update()).first() is None:
+    conn.execute(Watermark.__table__.insert().values(name=WATERMARK, value=now))
+  else:
+    conn.execute(Watermark.__table__.update().where(Watermark.name == WATERMARK).values(value=now))
+  for model, column in OWNERS:
+    table, owner_column = model.__table__, getattr(Show, column)
+    upcoming = select(func.count(Show.id)).where(owner_column == table.c.id, Show.start_time > now).scalar_subquery()
+    conn.execute(table.update().values(num_upcoming_shows=upcoming, updated_at=table.c.updated_at))
@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+from datetime import date
+
+from sqlalchemy import select
+
+from models import Venue, Artist, Show, venue_genres, artist_genres
+from queries import genre_names, split_genres
+
+#----------------------------------------------------------------------------#
+# Streaming exports.
+#----------------------------------------------------------------------------#
+
+# Rows come off a server-side cursor in fixed-size partitions and are encoded
+# one partition at a time, so memory stays flat however large the table is.
+
+EXPORTS = {
+  # kind: (model, genre link table and its owner column)
+  'venues': (Venue, venue_genres, 'venue_id'),
+  'artists': (Artist, artist_genres, 'artist_id'),
+  'shows': (Show, None, None),
+}
+
+FORMATS = {
+  'ndjson': 'application/x-ndjson',
+  'csv': 'text/csv',
+}
+
+BATCH_SIZE = 1000
+
+
+class ExportError(ValueError):
+  pass
+
+
+def export_select(kind, after_id=None, updated_since=None):
+  model, link_table, owner_column = EXPORTS[kind]
+  columns = list(model.__table__.columns)
+  if link_table is not None:
+    columns.append(genre_names(link_table, link_table.c[owner_column], model.id).label('genres'))
+  statement = select(*columns).order_by(model.id)
+  if after_id is not None:
+    statement = statement.where(model.id > after_id)
+  if updated_since is not None:
+    if not hasattr(model, 'updated_at'):
+      raise ExportError(f'{kind} has no modification timestamps; use after_id')
+    statement = statement.where(model.updated_at > updated_since)
+  return statement
+
+
+def encode_value(value):
+  return value.isoformat() if isinstance(value, date) else value
+
+
+def encode_ndjson(keys, rows):
+  lines = []
+  for row in rows:
+    record = {key: encode_value(value) for key, value in zip(keys, row)}
+    if 'genres' in record:
+      record['genres'] = split_genres(record['genres'])
+    lines.append(json.dumps(record, separators=(',', ':')) + '\n')
+  return ''.join(lines)
+
+
+def encode_csv(keys, rows, header=False):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  if header:
+    writer.writerow(keys)
+  genres_at = keys.index('genres') if 'genres' in keys else None
+  for row in rows:
+    values = [encode_value(value) for value in row]
+    if genres_at is not None:
+      values[genres_at] = ';'.join(split_genres(values[genres_at]))
+    writer.writerow(values)
+  return buffer.getvalue()
+
+
+def export_chunks(engine, kind, fmt, after_id=None, updated_since=None, batch_size=BATCH_SIZE):
+  # Built before the first yield so bad arguments fail before any output.
+  statement = export_select(kind, after_id, updated_since)
+  if fmt not in FORMATS:
+    raise ExportError(f'unknown format {fmt!r}')
+
+  def generate():
+    with engine.connect() as conn:
+      result = conn.execution_options(stream_results=True).execute(statement).yield_per(batch_size)
+      keys = list(result.keys())
+      if fmt == 'csv':
+        yield encode_csv(keys, [], header=True)
+      for rows in result.partitions():
+        yield encode_ndjson(keys, rows) if fmt == 'ndjson' else encode_csv(keys, rows)
+  return generate()
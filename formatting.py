@@ -0,0 +1,40 @@
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+#----------------------------------------------------------------------------#
+# Date formatting for templates.
+#----------------------------------------------------------------------------#
+
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def compiled_format(format='medium', locale='en'):
+  # Parse each Babel pattern and load each locale once per process.
+  return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def format_native_datetime(value, format='medium', locale='en'):
+  # Listings repeat the same start times, so finished strings are memoized too.
+  pattern, compiled_locale = compiled_format(format, locale)
+  return pattern.apply(value, compiled_locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+  if isinstance(value, str):
+    # Older callers passed strings; rows from the query layer are datetimes.
+    value = dateutil.parser.parse(value)
+  return format_native_datetime(value, format, locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+  # Batch form for whole lists: one pattern lookup, then one call per value.
+  pattern, compiled_locale = compiled_format(format, locale)
+  return [pattern.apply(value, compiled_locale) for value in values]
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, Optional
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +15,11 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # Blank for the default show length.
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
 
 class VenueForm(Form):
     name = StringField(
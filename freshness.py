@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from itertools import chain
+
+from flask import current_app, g, make_response, request, session as flask_session
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+from werkzeug.wrappers import Response
+
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Modification timestamps and conditional responses.
+#----------------------------------------------------------------------------#
+
+# Writes stamp updated_at (UTC) on the rows they change, and on the rows whose
+# pages display them: a show's venue and artist, and the artists playing at a
+# renamed venue (and vice versa). A page is then unchanged while a few indexed
+# max() lookups return the same values. Those values make up its ETag and
+# Last-Modified, and a matching request gets a 304 without running the page query.
+
+TRACKED = (Venue, Artist, Show)
+
+# Fields that appear on the counterpart's detail page.
+DISPLAYED = ('name', 'image_link')
+
+
+def touch(conn, model, ids, now):
+  # Bumps updated_at on rows written around the ORM (bulk imports, Core inserts).
+  ids = {id for id in ids if id is not None}
+  if ids:
+    conn.execute(model.__table__.update().where(model.id.in_(ids)).values(updated_at=now))
+
+
+def related_ids(obj, attr):
+  history = inspect(obj).attrs[attr].history
+  return {getattr(obj, attr)} | set(history.deleted or ())
+
+
+def displayed_fields_changed(obj):
+  state = inspect(obj)
+  return any(state.attrs[field].history.has_changes() for field in DISPLAYED)
+
+
+@event.listens_for(Session, 'before_flush')
+def stamp_updated_at(session, flush_context, instances):
+  now = datetime.utcnow()
+  venues, artists = set(), set()
+  renamed = {Venue: set(), Artist: set()}
+  for obj in session.new:
+    if isinstance(obj, TRACKED):
+      obj.updated_at = now
+  for obj in session.dirty:
+    if isinstance(obj, TRACKED) and session.is_modified(obj):
+      obj.updated_at = now
+      if isinstance(obj, (Venue, Artist)) and displayed_fields_changed(obj):
+        renamed[type(obj)].add(obj.id)
+  for obj in chain(session.new, session.dirty, session.deleted):
+    if isinstance(obj, Show):
+      venues |= related_ids(obj, 'venue_id')
+      artists |= related_ids(obj, 'artist_id')
+
+  touch(session, Venue, venues, now)
+  touch(session, Artist, artists, now)
+  if renamed[Venue]:
+    played = select(Show.artist_id).where(Show.venue_id.in_(renamed[Venue]))
+    session.execute(Artist.__table__.update().where(Artist.id.in_(played)).values(updated_at=now))
+  if renamed[Artist]:
+    played = select(Show.venue_id).where(Show.artist_id.in_(renamed[Artist]))
+    session.execute(Venue.__table__.update().where(Venue.id.in_(played)).values(updated_at=now))
+
+# ---------------------------------------------------------------------------#
+# What each page depends on
+# ---------------------------------------------------------------------------#
+# Each function returns one row of timestamps. updated_at values are UTC;
+# "started" is the newest show start that has passed (local time, like
+# start_time itself), which moves shows from upcoming to past without a write.
+
+def latest(column, *criteria):
+  return select(func.max(column)).where(*criteria).scalar_subquery()
+
+
+def venue_freshness(now, venue_id):
+  return select(
+    select(Venue.updated_at).where(Venue.id == venue_id).scalar_subquery().label('updated_at'),
+    latest(Show.start_time, Show.venue_id == venue_id, Show.start_time <= now).label('started'),
+  )
+
+
+def artist_freshness(now, artist_id):
+  return select(
+    select(Artist.updated_at).where(Artist.id == artist_id).scalar_subquery().label('updated_at'),
+    latest(Show.start_time, Show.artist_id == artist_id, Show.start_time <= now).label('started'),
+  )
+
+
+def venues_freshness(now):
+  return select(
+    latest(Venue.updated_at).label('venues_updated_at'),
+    latest(Show.updated_at).label('shows_updated_at'),
+    latest(Show.start_time, Show.start_time <= now).label('started'),
+  )
+
+
+def artists_freshness(now):
+  return select(latest(Artist.updated_at).label('artists_updated_at'))
+
+
+def shows_freshness(now):
+  columns = [
+    latest(Show.updated_at).label('shows_updated_at'),
+    latest(Venue.updated_at).label('venues_updated_at'),
+    latest(Artist.updated_at).label('artists_updated_at'),
+  ]
+  if request.args.get('when'):
+    # ?when=upcoming|past: a show changes sides when it starts.
+    columns.append(latest(Show.start_time, Show.start_time <= now).label('started'))
+  return select(*columns)
+
+
+def fetch_validators(statement, session=None):
+  session = db.session if session is None else session
+  return session.execute(statement).one()
+
+# ---------------------------------------------------------------------------#
+# Conditional GET
+# ---------------------------------------------------------------------------#
+
+def template_version(template_folder):
+  # Part of every ETag, so a deploy that changes the markup changes the tags.
+  digest = hashlib.sha1()
+  for root, dirs, files in sorted(os.walk(template_folder)):
+    dirs.sort()
+    for name in sorted(files):
+      with open(os.path.join(root, name), 'rb') as handle:
+        digest.update(name.encode() + handle.read())
+  return digest.hexdigest()[:12]
+
+
+def validators(row):
+  # (etag, last_modified) for a row of freshness values, or None when the
+  # entity does not exist and the view should answer for itself.
+  if 'updated_at' in row._fields and row.updated_at is None:
+    return None
+  moments = []
+  for key, value in row._mapping.items():
+    if value is not None:
+      moments.append(value.astimezone(timezone.utc) if key == 'started' else value.replace(tzinfo=timezone.utc))
+  version = current_app.extensions['etag_version']
+  raw = '|'.join([version, request.full_path] + [value.isoformat() if value else '' for value in row])
+  return hashlib.sha1(raw.encode()).hexdigest()[:20], max(moments, default=None)
+
+
+def checkable():
+  # Pending flashes are rendered into the page, like in the page cache.
+  return request.method in ('GET', 'HEAD') and not flask_session.get('_flashes')
+
+
+def respond(tags, response):
+  etag, last_modified = tags
+  response.set_etag(etag, weak=True)
+  response.last_modified = last_modified
+  # Clients and CDNs may store the page but must revalidate it every time.
+  response.cache_control.no_cache = True
+  return response
+
+
+def not_modified(tags):
+  return respond(tags, Response(status=304))
+
+
+def unchanged(tags):
+  etag, last_modified = tags
+  return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def conditional(freshness, execute=None):
+  # freshness(now, **view_args) -> a select of one row of timestamps. Async
+  # views pass execute, a coroutine running fetch_validators on their engine.
+  # The ETag is left in g.etag, which the page cache keys its entries by.
+  def decorator(view):
+    if asyncio.iscoroutinefunction(view):
+      @wraps(view)
+      async def async_wrapper(**kwargs):
+        if not checkable():
+          return await view(**kwargs)
+        tags = validators(await execute(freshness(datetime.now(), **kwargs)))
+        if tags is None:
+          return await view(**kwargs)
+        g.etag = tags[0]
+        if unchanged(tags):
+          return not_modified(tags)
+        response = make_response(await view(**kwargs))
+        return respond(tags, response) if response.status_code == 200 else response
+      async_wrapper.freshness = freshness
+      return async_wrapper
+
+    @wraps(view)
+    def wrapper(**kwargs):
+      if not checkable():
+        return view(**kwargs)
+      tags = validators(fetch_validators(freshness(datetime.now(), **kwargs)))
+      if tags is None:
+        return view(**kwargs)
+      g.etag = tags[0]
+      if unchanged(tags):
+        return not_modified(tags)
+      response = make_response(view(**kwargs))
+      return respond(tags, response) if response.status_code == 200 else response
+    wrapper.freshness = freshness
+    return wrapper
+  return decorator
+
+
+def init_app(app):
+  version = template_version(os.path.join(app.root_path, app.template_folder))
+  # Pages link to fingerprinted assets, so a new asset build changes them too.
+  assets = json.dumps(app.extensions.get('assets', {}), sort_keys=True)
+  app.extensions['etag_version'] = hashlib.sha1(f'{version}{assets}'.encode()).hexdigest()[:12]
@@ -0,0 +1,305 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import click
+import dateutil.parser
+from sqlalchemy import func, select, text
+
+from availability import BookingError, check_bookings
+from counters import count_inserted_shows
+from freshness import touch
+from models import db, Genre, Venue, Artist, Show, SHOW_LENGTH, venue_genres, artist_genres
+
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#----------------------------------------------------------------------------#
+
+# Files are streamed and written in batches: one executemany per table per
+# batch (COPY on Postgres), one commit per batch. Rows that fail validation
+# are reported and skipped; a batch the database rejects is retried row by
+# row so only the offending rows are lost. Shows that would double-book a
+# venue are rejected the same way.
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n', ''}
+
+
+class BadRow(ValueError):
+  pass
+
+
+def read_rows(path, fmt=None):
+  # Yields (line number, dict) pairs, or (line number, BadRow) for unparsable lines.
+  fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+  with open(path, newline='', encoding='utf-8') as handle:
+    if fmt == 'csv':
+      reader = csv.DictReader(handle)
+      for row in reader:
+        yield reader.line_num, row
+      return
+    for number, line in enumerate(handle, 1):
+      if not line.strip():
+        continue
+      try:
+        row = json.loads(line)
+      except ValueError as error:
+        yield number, BadRow(f'invalid JSON: {error}')
+        continue
+      yield number, row if isinstance(row, dict) else BadRow('expected a JSON object')
+
+
+def required(row, field):
+  value = row.get(field)
+  if value is None or str(value).strip() == '':
+    raise BadRow(f'missing {field}')
+  return str(value).strip()
+
+
+def optional(row, field):
+  value = row.get(field)
+  if value is None:
+    return None
+  return str(value).strip() or None
+
+
+def boolean(row, field):
+  value = row.get(field)
+  if isinstance(value, bool):
+    return value
+  value = str(value if value is not None else '').strip().lower()
+  if value in TRUE_VALUES:
+    return True
+  if value in FALSE_VALUES:
+    return False
+  raise BadRow(f'{field} is not a boolean: {value!r}')
+
+
+def genre_list(row):
+  value = row.get('genres') or []
+  if isinstance(value, str):
+    value = value.replace(';', ',').split(',')
+  return [str(name).strip() for name in value if str(name).strip()]
+
+
+class IdMap:
+  # Existing ids and (case-insensitive) names of a table, loaded once per run.
+
+  def __init__(self, model):
+    self.ids = set()
+    self.names = {}
+    for row in db.session.execute(select(model.id, model.name)):
+      self.add(row.id, row.name)
+
+  def add(self, id, name):
+    self.ids.add(id)
+    if name:
+      key = name.strip().lower()
+      # Names shared by several rows cannot be resolved.
+      self.names[key] = None if key in self.names else id
+
+  def resolve(self, row, kind):
+    if row.get(f'{kind}_id') not in (None, ''):
+      try:
+        id = int(row[f'{kind}_id'])
+      except (TypeError, ValueError):
+        raise BadRow(f'{kind}_id is not an integer: {row[f"{kind}_id"]!r}')
+      if id not in self.ids:
+        raise BadRow(f'unknown {kind}_id {id}')
+      return id
+    name = optional(row, kind) or optional(row, f'{kind}_name')
+    if name is None:
+      raise BadRow(f'missing {kind}_id or {kind}')
+    key = name.lower()
+    if key not in self.names:
+      raise BadRow(f'unknown {kind} {name!r}')
+    if self.names[key] is None:
+      raise BadRow(f'ambiguous {kind} {name!r}; use {kind}_id')
+    return self.names[key]
+
+
+def venue_values(row, maps):
+  return {
+    "name": required(row, 'name'),
+    "city": required(row, 'city'),
+    "state": required(row, 'state'),
+    "address": optional(row, 'address'),
+    "phone": optional(row, 'phone'),
+    "image_link": optional(row, 'image_link'),
+    "facebook_link": optional(row, 'facebook_link'),
+    "website_link": optional(row, 'website_link') or optional(row, 'website'),
+    "seeking_talent": boolean(row, 'seeking_talent'),
+    "seeking_description": optional(row, 'seeking_description'),
+  }, genre_list(row)
+
+
+def artist_values(row, maps):
+  return {
+    "name": required(row, 'name'),
+    "city": optional(row, 'city'),
+    "state": optional(row, 'state'),
+    "phone": optional(row, 'phone'),
+    "image_link": optional(row, 'image_link'),
+    "facebook_link": optional(row, 'facebook_link'),
+    "website_link": optional(row, 'website_link') or optional(row, 'website'),
+    "seeking_venue": boolean(row, 'seeking_venue'),
+    "seeking_description": optional(row, 'seeking_description'),
+  }, genre_list(row)
+
+
+def parse_time(row, field):
+  try:
+    return dateutil.parser.parse(required(row, field)).replace(tzinfo=None)
+  except (ValueError, OverflowError) as error:
+    raise BadRow(f'bad {field}: {error}')
+
+
+def show_values(row, maps):
+  start_time = parse_time(row, 'start_time')
+  # Filled in here because COPY skips column defaults.
+  end_time = parse_time(row, 'end_time') if optional(row, 'end_time') else start_time + SHOW_LENGTH
+  return {
+    "artist_id": maps['artist'].resolve(row, 'artist'),
+    "venue_id": maps['venue'].resolve(row, 'venue'),
+    "start_time": start_time,
+    "end_time": end_time,
+  }, None
+
+
+KINDS = {
+  # kind: (model, row builder, genre link table, its owner column)
+  'venues': (Venue, venue_values, venue_genres, 'venue_id'),
+  'artists': (Artist, artist_values, artist_genres, 'artist_id'),
+  'shows': (Show, show_values, None, None),
+}
+
+
+def reserve_ids(conn, table, count):
+  # Ids are allocated up front so genre links can be written without RETURNING.
+  if conn.dialect.name == 'postgresql':
+    rows = conn.execute(text('SELECT nextval(pg_get_serial_sequence(:table, \'id\')) FROM generate_series(1, :count)'),
+                        {'table': f'"{table.name}"', 'count': count})
+    return [row[0] for row in rows]
+  start = (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+  return list(range(start, start + count))
+
+
+def copy_rows(conn, table, rows):
+  columns = list(rows[0])
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in rows:
+    writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+  buffer.seek(0)
+  names = ', '.join(f'"{column}"' for column in columns)
+  cursor = conn.connection.cursor()
+  cursor.copy_expert(f'COPY "{table.name}" ({names}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+
+
+def write_rows(conn, table, rows, use_copy):
+  if not rows:
+    return
+  if use_copy and conn.dialect.name == 'postgresql':
+    copy_rows(conn, table, rows)
+  else:
+    conn.execute(table.insert(), rows)
+
+
+class Importer:
+
+  def __init__(self, kind, batch_size=5000, use_copy=True, report=None):
+    self.kind = kind
+    self.model, self.build, self.link_table, self.link_column = KINDS[kind]
+    self.table = self.model.__table__
+    self.batch_size = batch_size
+    self.use_copy = use_copy
+    self.report = report or (lambda number, reason: click.echo(f'line {number}: {reason}', err=True))
+    self.maps = {'venue': IdMap(Venue), 'artist': IdMap(Artist)} if kind == 'shows' else {}
+    self.genre_ids = {genre.name: genre.id for genre in db.session.execute(select(Genre.id, Genre.name))}
+    self.read = self.written = self.bad = 0
+    db.session.close()
+
+  def run(self, path, fmt=None, progress=None):
+    started = time.perf_counter()
+    batch = []
+    for number, row in read_rows(path, fmt):
+      self.read += 1
+      try:
+        if isinstance(row, BadRow):
+          raise row
+        batch.append((number,) + self.build(row, self.maps))
+      except BadRow as error:
+        self.fail(number, error)
+      if len(batch) >= self.batch_size:
+        self.flush(batch)
+        batch = []
+        if progress:
+          progress(self, time.perf_counter() - started)
+    self.flush(batch)
+    elapsed = time.perf_counter() - started
+    if progress:
+      progress(self, elapsed)
+    return elapsed
+
+  def fail(self, number, reason):
+    self.bad += 1
+    self.report(number, reason)
+
+  def flush(self, batch):
+    if not batch:
+      return
+    if self.link_table is not None:
+      self.ensure_genres(name for _, _, genres in batch for name in genres)
+    try:
+      with db.engine.begin() as conn:
+        self.write(conn, batch, self.use_copy)
+      self.written += len(batch)
+    except Exception:
+      # Isolate the rows the database rejects; the rest of the batch still lands.
+      for item in batch:
+        try:
+          with db.engine.begin() as conn:
+            self.write(conn, [item], False)
+          self.written += 1
+        except BookingError as error:
+          self.fail(item[0], error)
+        except Exception as error:
+          self.fail(item[0], f'rejected by database: {getattr(error, "orig", error)}')
+
+  def write(self, conn, batch, use_copy):
+    rows = [values for _, values, _ in batch]
+    # Stamped here because COPY skips column defaults.
+    now = datetime.utcnow()
+    for values in rows:
+      values['updated_at'] = now
+    if self.link_table is None:
+      check_bookings(conn, [(values['venue_id'], values['start_time'], values['end_time']) for values in rows])
+      write_rows(conn, self.table, rows, use_copy)
+      # New shows change their venues' and artists' pages.
+      touch(conn, Venue, {values['venue_id'] for values in rows}, now)
+      touch(conn, Artist, {values['artist_id'] for values in rows}, now)
+      count_inserted_shows(conn, rows)
+      return
+
+    for values, id in zip(rows, reserve_ids(conn, self.table, len(rows))):
+      values['id'] = id
+    links = []
+    for _, values, genres in batch:
+      for name in dict.fromkeys(genres):
+        links.append({self.link_column: values['id'], 'genre_id': self.genre_ids[name]})
+    write_rows(conn, self.table, rows, use_copy)
+    write_rows(conn, self.link_table, links, use_copy)
+
+  def ensure_genres(self, names):
+    # New genres are committed on their own so a rejected batch cannot roll them back.
+    missing = sorted(set(names) - set(self.genre_ids))
+    if not missing:
+      return
+    with db.engine.begin() as conn:
+      for name in missing:
+        id = conn.execute(select(Genre.id).where(Genre.name == name)).scalar()
+        if id is None:
+          id = conn.execute(Genre.__table__.insert().values(name=name)).inserted_primary_key[0]
+        self.genre_ids[name] = id
@@ -0,0 +1,53 @@
+from bisect import bisect_left
+
+#----------------------------------------------------------------------------#
+# Interval tree.
+#----------------------------------------------------------------------------#
+
+# A static interval tree over half-open [start, end) intervals. The intervals
+# are sorted by start and read as an implicit balanced binary tree: the middle
+# of every range is that range's root. Each node records the latest end in its
+# subtree. A query descends only into subtrees that can hold an overlap, so it
+# costs O(log n + k) for k matches.
+
+
+class IntervalTree:
+
+  def __init__(self, intervals):
+    # intervals: (start, end, value) tuples, in any order.
+    self.items = sorted(intervals, key=lambda item: (item[0], item[1]))
+    self.starts = [item[0] for item in self.items]
+    self.max_end = [None] * len(self.items)
+    self._build(0, len(self.items))
+
+  def __len__(self):
+    return len(self.items)
+
+  def _build(self, low, high):
+    if low >= high:
+      return None
+    mid = (low + high) // 2
+    latest = self.items[mid][1]
+    for child in (self._build(low, mid), self._build(mid + 1, high)):
+      if child is not None and child > latest:
+        latest = child
+    self.max_end[mid] = latest
+    return latest
+
+  def overlapping(self, start, end):
+    # The intervals with item start < end and item end > start, in start order.
+    found = []
+    # Only the intervals that start before `end` can overlap.
+    self._collect(0, len(self.items), start, bisect_left(self.starts, end), found)
+    return found
+
+  def _collect(self, low, high, start, limit, found):
+    if low >= high or low >= limit:
+      return
+    mid = (low + high) // 2
+    if self.max_end[mid] <= start:
+      return
+    self._collect(low, mid, start, limit, found)
+    if mid < limit and self.items[mid][1] > start:
+      found.append(self.items[mid])
+    self._collect(mid + 1, high, start, limit, found)
@@ -0,0 +1,379 @@
+import atexit
+import heapq
+import json
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Work that does not have to finish before the response goes out runs on a
+# small thread pool in each app process. A handler defers a job while its
+# transaction is open. The job is queued when the transaction commits and
+# dropped if it rolls back. A failing job is retried with exponential backoff.
+# After JOB_MAX_ATTEMPTS failures it moves to the dead-letter list.
+#
+# Jobs are registered functions, stored by name with JSON arguments. The
+# 'memory' backend loses whatever is still queued when the process exits. The
+# 'sqlite' backend keeps jobs in a file shared by the workers on the host.
+# A job that was running when its process died runs again once its lease
+# expires, so jobs must be safe to run twice.
+
+TASKS = {}
+
+# How long a claimed job in the SQLite file belongs to its worker.
+LEASE_SECONDS = 300
+
+
+def task(function):
+  # Registers a function that can be queued as a job.
+  TASKS[function.__name__] = function
+  return function
+
+
+class Job:
+
+  def __init__(self, name, payload, id=None, attempts=0, run_at=None, error=None):
+    self.name = name
+    self.payload = payload
+    self.id = id
+    self.attempts = attempts
+    self.run_at = time.time() if run_at is None else run_at
+    self.error = error
+
+  def as_dict(self):
+    return {"id": self.id, "name": self.name, "args": json.loads(self.payload),
+            "attempts": self.attempts, "error": self.error}
+
+
+class MemoryBackend:
+  # Per-process heap ordered by run time.
+
+  def __init__(self, dead_letters):
+    self.ready = []
+    self.dead = deque(maxlen=dead_letters)
+    self.next_id = 1
+    self.stopped = False
+    self.condition = threading.Condition()
+
+  def put(self, job):
+    with self.condition:
+      if job.id is None:
+        job.id, self.next_id = self.next_id, self.next_id + 1
+      heapq.heappush(self.ready, (job.run_at, job.id, job))
+      self.condition.notify()
+
+  def claim(self, timeout):
+    deadline = time.monotonic() + timeout
+    with self.condition:
+      while not self.stopped:
+        now = time.time()
+        if self.ready and self.ready[0][0] <= now:
+          return heapq.heappop(self.ready)[2]
+        wait = deadline - time.monotonic()
+        if wait <= 0:
+          return None
+        if self.ready:
+          wait = min(wait, self.ready[0][0] - now)
+        self.condition.wait(wait)
+    return None
+
+  def done(self, job):
+    pass
+
+  def retry(self, job):
+    self.put(job)
+
+  def bury(self, job):
+    with self.condition:
+      self.dead.append(job)
+
+  def requeue_dead(self):
+    with self.condition:
+      jobs, self.dead = list(self.dead), deque(maxlen=self.dead.maxlen)
+    for job in jobs:
+      job.attempts, job.error, job.run_at = 0, None, time.time()
+      self.put(job)
+    return len(jobs)
+
+  def dead_letters(self, limit):
+    with self.condition:
+      return list(self.dead)[-limit:][::-1]
+
+  def stop(self):
+    with self.condition:
+      self.stopped = True
+      self.condition.notify_all()
+
+  def depth(self):
+    return len(self.ready)
+
+  def dead_count(self):
+    return len(self.dead)
+
+
+class SQLiteBackend:
+  # Shared by every worker on the host that points at the same file. Idle
+  # workers poll it, so jobs queued by other processes are picked up too.
+
+  POLL_SECONDS = 1.0
+
+  def __init__(self, path):
+    self.path = path
+    self.local = threading.local()
+    self.condition = threading.Condition()
+    self.puts = 0
+    self.stopped = False
+    with self.connection() as conn:
+      conn.executescript('''
+        CREATE TABLE IF NOT EXISTS jobs (
+          id INTEGER PRIMARY KEY, name TEXT NOT NULL, payload TEXT NOT NULL,
+          attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL,
+          state TEXT NOT NULL DEFAULT 'queued', error TEXT);
+        CREATE INDEX IF NOT EXISTS ix_jobs_state_run_at ON jobs (state, run_at);
+      ''')
+
+  def connection(self):
+    conn = getattr(self.local, 'conn', None)
+    if conn is None:
+      conn = self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+      conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+  def put(self, job):
+    conn = self.connection()
+    job.id = conn.execute('INSERT INTO jobs (name, payload, attempts, run_at) VALUES (?, ?, ?, ?)',
+                          (job.name, job.payload, job.attempts, job.run_at)).lastrowid
+    self.notify()
+
+  def claim(self, timeout):
+    deadline = time.monotonic() + timeout
+    while not self.stopped:
+      seen = self.puts
+      job = self.claim_next()
+      if job is not None:
+        return job
+      wait = min(deadline - time.monotonic(), self.POLL_SECONDS)
+      if wait <= 0:
+        return None
+      with self.condition:
+        self.condition.wait_for(lambda: self.puts != seen or self.stopped, wait)
+    return None
+
+  def claim_next(self):
+    # Running jobs whose lease ran out belonged to a worker that died.
+    now = time.time()
+    conn = self.connection()
+    with conn:
+      conn.execute('BEGIN IMMEDIATE')
+      row = conn.execute("SELECT id, name, payload, attempts FROM jobs WHERE state IN ('queued', 'running') "
+                         "AND run_at <= ? ORDER BY run_at, id LIMIT 1", (now,)).fetchone()
+      if row is None:
+        return None
+      conn.execute("UPDATE jobs SET state = 'running', run_at = ? WHERE id = ?", (now + LEASE_SECONDS, row[0]))
+    return Job(row[1], row[2], id=row[0], attempts=row[3])
+
+  def done(self, job):
+    self.connection().execute('DELETE FROM jobs WHERE id = ?', (job.id,))
+
+  def retry(self, job):
+    self.connection().execute("UPDATE jobs SET state = 'queued', attempts = ?, run_at = ?, error = ? WHERE id = ?",
+                              (job.attempts, job.run_at, job.error, job.id))
+
+  def bury(self, job):
+    self.connection().execute("UPDATE jobs SET state = 'dead', attempts = ?, error = ? WHERE id = ?",
+                              (job.attempts, job.error, job.id))
+
+  def requeue_dead(self):
+    count = self.connection().execute("UPDATE jobs SET state = 'queued', attempts = 0, run_at = ?, error = NULL "
+                                      "WHERE state = 'dead'", (time.time(),)).rowcount
+    self.notify()
+    return count
+
+  def dead_letters(self, limit):
+    rows = self.connection().execute("SELECT name, payload, id, attempts, run_at, error FROM jobs "
+                                     "WHERE state = 'dead' ORDER BY id DESC LIMIT ?", (limit,))
+    return [Job(*row) for row in rows]
+
+  def notify(self):
+    with self.condition:
+      self.puts += 1
+      self.condition.notify_all()
+
+  def stop(self):
+    with self.condition:
+      self.stopped = True
+      self.condition.notify_all()
+
+  def depth(self):
+    return self.connection().execute("SELECT count(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+  def dead_count(self):
+    return self.connection().execute("SELECT count(*) FROM jobs WHERE state = 'dead'").fetchone()[0]
+
+
+class JobQueue:
+
+  def __init__(self, app=None):
+    self.app = None
+    self.backend = None
+    self.size = 2
+    self.max_attempts = 3
+    self.retry_delay = 1.0
+    self.drain_timeout = 10.0
+    self.workers = []
+    self.lock = threading.Lock()
+    self.closed = False
+    self.stopping = False
+    self.running = 0
+    self.completed = 0
+    self.retried = 0
+    self.dead = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    kind = app.config.get('JOB_QUEUE_BACKEND', 'memory')
+    self.size = app.config.get('JOB_QUEUE_WORKERS', 2)
+    self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 3)
+    self.retry_delay = app.config.get('JOB_RETRY_DELAY', 1.0)
+    self.drain_timeout = app.config.get('JOB_DRAIN_TIMEOUT', 10.0)
+    if kind == 'memory':
+      self.backend = MemoryBackend(app.config.get('JOB_DEAD_LETTERS', 100))
+    elif kind == 'sqlite':
+      self.backend = SQLiteBackend(app.config.get('JOB_QUEUE_PATH', 'jobs.db'))
+    elif kind not in (None, '', 'none'):
+      raise ValueError(f'Unknown JOB_QUEUE_BACKEND {kind!r}')
+
+    event.listen(Session, 'after_commit', self.enqueue_committed)
+    event.listen(Session, 'after_soft_rollback', self.discard_deferred)
+    if self.backend is not None:
+      # Workers start on the first request rather than at import, so a
+      # preforking server starts them in each worker after the fork. Jobs left
+      # in the SQLite file by an earlier run are picked up then.
+      app.before_request(self.start)
+      atexit.register(self.shutdown)
+    app.extensions['jobs'] = self
+
+  def defer(self, name, *args, session=None):
+    # Queues the job when the session's transaction commits.
+    session = db.session if session is None else session
+    session.info.setdefault('deferred_jobs', []).append((name, args))
+
+  def enqueue_committed(self, session):
+    for name, args in session.info.pop('deferred_jobs', ()):
+      self.enqueue(name, *args)
+
+  def discard_deferred(self, session, previous_transaction):
+    session.info.pop('deferred_jobs', None)
+
+  def enqueue(self, name, *args):
+    name = getattr(name, '__name__', name)
+    if name not in TASKS:
+      raise KeyError(f'Unknown job {name!r}')
+    job = Job(name, json.dumps(args))
+    if self.backend is None:
+      # No backend: run once while the caller waits. On a thread of its own,
+      # because the app context's session is per thread and the caller may
+      # be in the middle of committing it.
+      runner = threading.Thread(target=self.run, args=(job,))
+      runner.start()
+      runner.join()
+      return job
+    if self.closed:
+      raise RuntimeError('The job queue is shut down')
+    self.backend.put(job)
+    self.start()
+    return job
+
+  def start(self):
+    if len(self.workers) >= self.size or self.closed:
+      return
+    with self.lock:
+      while len(self.workers) < self.size:
+        worker = threading.Thread(target=self.work, name=f'jobs-{len(self.workers) + 1}', daemon=True)
+        self.workers.append(worker)
+        worker.start()
+
+  def work(self):
+    while True:
+      job = self.backend.claim(timeout=1.0)
+      if job is not None:
+        self.run(job)
+      elif self.stopping:
+        return
+
+  def run(self, job):
+    with self.lock:
+      self.running += 1
+    try:
+      with self.app.app_context():
+        TASKS[job.name](*json.loads(job.payload))
+    except Exception as error:
+      self.fail(job, error)
+    else:
+      if self.backend is not None:
+        self.backend.done(job)
+      with self.lock:
+        self.completed += 1
+    finally:
+      with self.lock:
+        self.running -= 1
+
+  def fail(self, job, error):
+    job.attempts += 1
+    job.error = ''.join(traceback.format_exception_only(type(error), error)).strip()
+    if self.backend is None:
+      self.app.logger.error(f'Job {job.name} failed: {job.error}', exc_info=error)
+    elif job.attempts < self.max_attempts:
+      job.run_at = time.time() + self.retry_delay * 2 ** (job.attempts - 1)
+      self.backend.retry(job)
+      with self.lock:
+        self.retried += 1
+      self.app.logger.warning(f'Job {job.name} #{job.id} failed (attempt {job.attempts} of {self.max_attempts}): {job.error}')
+    else:
+      self.backend.bury(job)
+      with self.lock:
+        self.dead += 1
+      self.app.logger.error(f'Job {job.name} #{job.id} failed {job.attempts} times; moved to dead letters',
+                            exc_info=error)
+
+  def shutdown(self, timeout=None):
+    # Stops taking jobs, gives the queued and running ones up to `timeout`
+    # seconds to finish, then stops the workers. Returns the jobs left queued.
+    if self.backend is None or self.stopping:
+      return 0
+    self.closed = True
+    deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+    while self.workers and (self.backend.depth() or self.running) and time.monotonic() < deadline:
+      time.sleep(0.05)
+    self.stopping = True
+    self.backend.stop()
+    for worker in self.workers:
+      worker.join(max(deadline - time.monotonic(), 0) + 1.0)
+    left = self.backend.depth()
+    if left and isinstance(self.backend, MemoryBackend):
+      self.app.logger.warning(f'Job queue shut down with {left} jobs still queued; they are lost')
+    return left
+
+  def stats(self):
+    return {
+      "backend": type(self.backend).__name__ if self.backend else None,
+      "workers": sum(worker.is_alive() for worker in self.workers),
+      "queued": self.backend.depth() if self.backend else 0,
+      "running": self.running,
+      "completed": self.completed,
+      "retried": self.retried,
+      "dead": self.backend.dead_count() if self.backend else 0,
+      "dead_letters": [job.as_dict() for job in self.backend.dead_letters(10)] if self.backend else [],
+    }
@@ -0,0 +1,30 @@
+"""composite indexes for show lookups
+
+Revision ID: 05ee475dd115
+Revises: a7a39ad6f910
+Create Date: 2026-10-18 09:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '05ee475dd115'
+down_revision = 'a7a39ad6f910'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,40 @@
+"""add updated_at to Venue, Artist and Show
+
+Revision ID: 3c81e0b7d2a4
+Revises: fcfa343fa6a4
+Create Date: 2026-10-18 15:02:47.118233
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c81e0b7d2a4'
+down_revision = 'fcfa343fa6a4'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    # Existing rows are stamped with the migration time through a constant
+    # default, which Postgres 11+ records without rewriting the table. The
+    # default is dropped again: new values come from the application.
+    stamp = datetime.utcnow().replace(microsecond=0).isoformat(' ')
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text(f"'{stamp}'")))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), server_default=None)
+        op.create_index(f'ix_{table}_updated_at', table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
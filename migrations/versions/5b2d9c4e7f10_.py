@@ -0,0 +1,57 @@
+"""add upcoming-show counters to Venue and Artist
+
+Revision ID: 5b2d9c4e7f10
+Revises: 3c81e0b7d2a4
+Create Date: 2026-10-18 16:21:09.402118
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2d9c4e7f10'
+down_revision = '3c81e0b7d2a4'
+branch_labels = None
+depends_on = None
+
+OWNERS = (
+    # (owner table, its key column in Show)
+    ('Venue', 'venue_id'),
+    ('Artist', 'artist_id'),
+)
+
+show = sa.table('Show', sa.column('id', sa.Integer), sa.column('venue_id', sa.Integer),
+                sa.column('artist_id', sa.Integer), sa.column('start_time', sa.DateTime))
+
+
+def upgrade():
+    watermark = op.create_table('Watermark',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('value', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    # Counters hold the shows after this moment; start_time is local time.
+    now = datetime.now()
+    op.bulk_insert(watermark, [{'name': 'upcoming_shows', 'value': now}])
+
+    for table, column in OWNERS:
+        op.add_column(table, sa.Column('num_upcoming_shows', sa.Integer(), nullable=False, server_default='0'))
+        owner = sa.table(table, sa.column('id', sa.Integer), sa.column('num_upcoming_shows', sa.Integer))
+        # Owners with no upcoming shows keep the default; the rest are counted
+        # once, through the (owner, start_time) index.
+        upcoming = sa.select(sa.func.count(show.c.id)) \
+            .where(show.c[column] == owner.c.id, show.c.start_time > now) \
+            .scalar_subquery()
+        op.execute(owner.update()
+                   .where(owner.c.id.in_(sa.select(show.c[column]).where(show.c.start_time > now)))
+                   .values(num_upcoming_shows=upcoming))
+
+
+def downgrade():
+    for table, _ in OWNERS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('num_upcoming_shows')
+    op.drop_table('Watermark')
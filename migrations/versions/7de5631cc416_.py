@@ -0,0 +1,33 @@
+"""trigram indexes for name search
+
+Revision ID: 7de5631cc416
+Revises: 05ee475dd115
+Create Date: 2026-10-18 10:03:17.204655
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7de5631cc416'
+down_revision = '05ee475dd115'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
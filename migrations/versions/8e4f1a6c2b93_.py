@@ -0,0 +1,151 @@
+"""partition Show by month of start_time (Postgres)
+
+Revision ID: 8e4f1a6c2b93
+Revises: 5b2d9c4e7f10
+Create Date: 2026-10-18 17:05:41.730265
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f1a6c2b93'
+down_revision = '5b2d9c4e7f10'
+branch_labels = None
+depends_on = None
+
+# Rebuilds Show as a table partitioned by RANGE (start_time), one partition per
+# month plus a default, without taking the table offline:
+#
+#   1. create the partitioned twin "Show_partitioned" and a trigger that
+#      mirrors every write on "Show" into it;
+#   2. copy the existing rows across in id batches, each its own transaction;
+#   3. in one short transaction, lock "Show", drop it and rename the twin.
+#
+# Requires PostgreSQL 12 or later. Other databases keep the plain table.
+
+TWIN = 'Show_partitioned'
+DEFAULT_PARTITION = 'Show_default'
+MONTHS_AHEAD = 12
+BATCH_SIZE = 10000
+
+INDEXES = (
+    ('ix_Show_venue_id_start_time', 'venue_id, start_time'),
+    ('ix_Show_artist_id_start_time', 'artist_id, start_time'),
+    ('ix_Show_start_time_id', 'start_time, id'),
+    ('ix_Show_updated_at', 'updated_at'),
+)
+
+FOREIGN_KEYS = (
+    ('Show_venue_id_fkey', 'venue_id', 'Venue'),
+    ('Show_artist_id_fkey', 'artist_id', 'Artist'),
+)
+
+
+def add_months(month, count):
+    years, index = divmod(month.month - 1 + count, 12)
+    return month.replace(year=month.year + years, month=index + 1)
+
+
+def month_of(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def create_partitions(bind):
+    now = datetime.now()
+    first, last = bind.execute(sa.text('SELECT min(start_time), max(start_time) FROM "Show"')).first()
+    month = month_of(min(first or now, now))
+    end = month_of(max(last or now, add_months(now, MONTHS_AHEAD)))
+    while month <= end:
+        upper = add_months(month, 1)
+        op.execute(f'CREATE TABLE "Show_p{month:%Y%m}" PARTITION OF "{TWIN}" '
+                   f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')")
+        month = upper
+    # Catches shows beyond the last partition until `flask partition-shows` adds one.
+    op.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TWIN}" DEFAULT')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    sequence = bind.execute(sa.text("""SELECT pg_get_serial_sequence('"Show"', 'id')""")).scalar()
+
+    # 1. The twin shares Show's columns, defaults and id sequence. Unique keys on
+    # a partitioned table must include the partition key, hence (id, start_time).
+    op.execute(f'CREATE TABLE "{TWIN}" (LIKE "Show" INCLUDING DEFAULTS) PARTITION BY RANGE (start_time)')
+    op.execute(f'ALTER TABLE "{TWIN}" ADD CONSTRAINT "{TWIN}_pkey" PRIMARY KEY (id, start_time)')
+    for name, column, target in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE "{TWIN}" ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) REFERENCES "{target}" (id)')
+    create_partitions(bind)
+    for name, columns in INDEXES:
+        op.execute(f'CREATE INDEX "{name}_partitioned" ON "{TWIN}" ({columns})')
+
+    op.execute(f"""
+        CREATE FUNCTION show_partition_sync() RETURNS trigger AS $$
+        BEGIN
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM "{TWIN}" WHERE id = OLD.id;
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO "{TWIN}" SELECT (NEW).*;
+          END IF;
+          RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    # Creating the trigger waits for in-flight writers, so every write
+    # committed after this point is mirrored and every earlier one is copied.
+    op.execute('CREATE TRIGGER show_partition_sync AFTER INSERT OR UPDATE OR DELETE ON "Show" '
+               'FOR EACH ROW EXECUTE FUNCTION show_partition_sync()')
+
+    # 2. Batches commit one by one, so writers only ever wait on one batch's
+    # rows. FOR SHARE makes a batch copy the latest version of a row that is
+    # being updated; the trigger has then already written that version and
+    # ON CONFLICT skips it.
+    with op.get_context().autocommit_block():
+        last_id = bind.execute(sa.text('SELECT max(id) FROM "Show"')).scalar() or 0
+        for lower in range(0, last_id, BATCH_SIZE):
+            bind.execute(sa.text(f"""
+                WITH batch AS (
+                    SELECT * FROM "Show" WHERE id > :lower AND id <= :upper FOR SHARE
+                )
+                INSERT INTO "{TWIN}" SELECT * FROM batch ON CONFLICT DO NOTHING
+            """), {'lower': lower, 'upper': lower + BATCH_SIZE})
+
+    # 3. The swap. The sequence is detached first so dropping the old table keeps it.
+    op.execute('LOCK TABLE "Show" IN ACCESS EXCLUSIVE MODE')
+    op.execute('DROP TRIGGER show_partition_sync ON "Show"')
+    op.execute('DROP FUNCTION show_partition_sync()')
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    op.execute('DROP TABLE "Show"')
+    op.execute(f'ALTER TABLE "{TWIN}" RENAME TO "Show"')
+    op.execute(f'ALTER INDEX "{TWIN}_pkey" RENAME TO "Show_pkey"')
+    for name, _ in INDEXES:
+        op.execute(f'ALTER INDEX "{name}_partitioned" RENAME TO "{name}"')
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY "Show".id')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    # Not online: copies every attached partition back into a plain table.
+    # Partitions detached by `flask partition-shows` stay where they are.
+    sequence = bind.execute(sa.text("""SELECT pg_get_serial_sequence('"Show"', 'id')""")).scalar()
+    op.execute('CREATE TABLE "Show_unpartitioned" (LIKE "Show" INCLUDING DEFAULTS)')
+    op.execute('INSERT INTO "Show_unpartitioned" SELECT * FROM "Show"')
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    op.execute('DROP TABLE "Show"')
+    op.execute('ALTER TABLE "Show_unpartitioned" RENAME TO "Show"')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "Show_pkey" PRIMARY KEY (id)')
+    for name, column, target in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) REFERENCES "{target}" (id)')
+    for name, columns in INDEXES:
+        op.execute(f'CREATE INDEX "{name}" ON "Show" ({columns})')
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY "Show".id')
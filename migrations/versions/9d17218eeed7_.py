@@ -0,0 +1,26 @@
+"""order shows by (start_time, id) for keyset pagination
+
+Revision ID: 9d17218eeed7
+Revises: 7de5631cc416
+Create Date: 2026-10-18 11:26:52.730114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d17218eeed7'
+down_revision = '7de5631cc416'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.drop_index('ix_Show_start_time', table_name='Show')
+
+
+def downgrade():
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
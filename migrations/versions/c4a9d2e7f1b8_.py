@@ -0,0 +1,91 @@
+"""add Show.end_time and forbid overlapping shows at a venue
+
+Revision ID: c4a9d2e7f1b8
+Revises: 8e4f1a6c2b93
+Create Date: 2026-10-18 19:12:04.518327
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9d2e7f1b8'
+down_revision = '8e4f1a6c2b93'
+branch_labels = None
+depends_on = None
+
+# Shows booked before this revision have no end. Each gets the default length,
+# cut short where the venue's next show starts, so existing bookings never
+# overlap. Exact duplicates end up empty.
+SHOW_LENGTH = timedelta(hours=2)
+BATCH_SIZE = 10000
+
+# Postgres only. Exclusion constraints cannot be declared on a partitioned
+# table, so each partition gets its own. Overlapping single-value int4ranges
+# stand in for venue_id equality, which would otherwise need btree_gist.
+NO_OVERLAP = "EXCLUDE USING gist (int4range(venue_id, venue_id, '[]') WITH &&, tsrange(start_time, end_time) WITH &&)"
+LENGTH_CHECK = "CHECK (end_time >= start_time AND end_time <= start_time + interval '1 day')"
+
+show = sa.table('Show', sa.column('id', sa.Integer), sa.column('venue_id', sa.Integer),
+                sa.column('start_time', sa.DateTime), sa.column('end_time', sa.DateTime))
+
+
+def tables(bind):
+    # The partitions of Show, or Show itself when it is a plain table.
+    names = [row[0] for row in bind.execute(sa.text(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = '\"Show\"'::regclass ORDER BY 1"
+    ))]
+    return names or ['Show']
+
+
+def backfill(bind):
+    rows = bind.execute(sa.select(show.c.id, show.c.venue_id, show.c.start_time)
+                        .order_by(show.c.venue_id, show.c.start_time, show.c.id)).all()
+    updates = []
+    for current, following in zip(rows, rows[1:] + [None]):
+        end_time = current.start_time + SHOW_LENGTH
+        if following is not None and following.venue_id == current.venue_id:
+            end_time = min(end_time, following.start_time)
+        updates.append({'show_id': current.id, 'new_end_time': end_time})
+    statement = show.update().where(show.c.id == sa.bindparam('show_id')) \
+        .values(end_time=sa.bindparam('new_end_time'))
+    for start in range(0, len(updates), BATCH_SIZE):
+        bind.execute(statement, updates[start:start + BATCH_SIZE])
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if bind.dialect.name == 'postgresql':
+        op.execute(f"""
+            UPDATE "Show" SET end_time = LEAST(ordered.start_time + interval '{SHOW_LENGTH.seconds} seconds', ordered.next_start)
+            FROM (
+                SELECT id, start_time,
+                       lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_start
+                FROM "Show"
+            ) AS ordered
+            WHERE "Show".id = ordered.id AND "Show".start_time = ordered.start_time
+        """)
+    else:
+        backfill(bind)
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if bind.dialect.name == 'postgresql':
+        op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "ck_Show_end_time" {LENGTH_CHECK}')
+        for name in tables(bind):
+            op.execute(f'ALTER TABLE "{name}" ADD CONSTRAINT "{name}_no_overlap" {NO_OVERLAP}')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for name in tables(bind):
+            op.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT IF EXISTS "{name}_no_overlap"')
+        op.execute('ALTER TABLE "Show" DROP CONSTRAINT "ck_Show_end_time"')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
@@ -0,0 +1,129 @@
+"""normalize genres into a Genre table with link tables
+
+Revision ID: fcfa343fa6a4
+Revises: 9d17218eeed7
+Create Date: 2026-10-18 13:41:08.662907
+
+"""
+import ast
+import csv
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fcfa343fa6a4'
+down_revision = '9d17218eeed7'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+genre = sa.table('Genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+OWNERS = (
+    # (owner table, link table, owner key column, legacy column type)
+    ('Venue', 'venue_genres', 'venue_id', sa.String()),
+    ('Artist', 'artist_genres', 'artist_id', sa.String(length=120)),
+)
+
+
+def parse_genres(value):
+    # The old column held whatever the form list was coerced to: a Postgres
+    # array literal, a Python list repr, or plain comma-separated text.
+    value = (value or '').strip()
+    if not value:
+        return []
+    if value.startswith('{') and value.endswith('}'):
+        names = next(csv.reader([value[1:-1]], quotechar='"', escapechar='\\'), [])
+    elif value.startswith('[') and value.endswith(']'):
+        try:
+            names = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            names = value[1:-1].split(',')
+    else:
+        names = value.split(',')
+    return list(dict.fromkeys(str(name).strip().strip('\'"') for name in names if str(name).strip()))
+
+
+def genre_ids(conn, names, known):
+    missing = [name for name in names if name not in known]
+    if missing:
+        conn.execute(genre.insert(), [{'name': name} for name in missing])
+        for row in conn.execute(sa.select(genre.c.id, genre.c.name).where(genre.c.name.in_(missing))):
+            known[row.name] = row.id
+    return [known[name] for name in names]
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner, link, key, _ in OWNERS:
+        op.create_table(link,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], [f'{owner}.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key, 'genre_id')
+        )
+        op.create_index(f'ix_{link}_genre_id_{key}', link, ['genre_id', key], unique=False)
+
+    conn = op.get_bind()
+    known = {}
+    for owner, link, key, _ in OWNERS:
+        owners = sa.table(owner, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        links = sa.table(link, sa.column(key, sa.Integer), sa.column('genre_id', sa.Integer))
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                sa.select(owners.c.id, owners.c.genres)
+                .where(owners.c.id > last_id).order_by(owners.c.id).limit(BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            pairs = []
+            for row in rows:
+                pairs.extend({key: row.id, 'genre_id': genre_id}
+                             for genre_id in genre_ids(conn, parse_genres(row.genres), known))
+            if pairs:
+                conn.execute(links.insert(), pairs)
+            last_id = rows[-1].id
+
+    for owner, _, _, _ in OWNERS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    conn = op.get_bind()
+    for owner, link, key, column_type in OWNERS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.add_column(sa.Column('genres', column_type, nullable=True))
+
+        owners = sa.table(owner, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        links = sa.table(link, sa.column(key, sa.Integer), sa.column('genre_id', sa.Integer))
+        last_id = 0
+        while True:
+            ids = [row.id for row in conn.execute(
+                sa.select(owners.c.id).where(owners.c.id > last_id).order_by(owners.c.id).limit(BATCH_SIZE))]
+            if not ids:
+                break
+            names = {}
+            for row in conn.execute(
+                    sa.select(links.c[key], genre.c.name)
+                    .join(genre, genre.c.id == links.c.genre_id)
+                    .where(links.c[key].in_(ids))):
+                names.setdefault(row[0], []).append(row.name)
+            for owner_id, owner_names in names.items():
+                literal = '{' + ','.join(f'"{name}"' if ' ' in name else name for name in sorted(owner_names)) + '}'
+                conn.execute(owners.update().where(owners.c.id == owner_id).values(genres=literal))
+            last_id = ids[-1]
+
+        op.drop_index(f'ix_{link}_genre_id_{key}', table_name=link)
+        op.drop_table(link)
+    op.drop_table('Genre')
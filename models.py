@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import DDL, event
+
+from routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+# The name indexes below use pg_trgm's operator class. Migration 7de5631cc416
+# creates the extension; this does the same for create_all().
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Genre {self.id} {self.name}>'
+
+    @classmethod
+    def named(cls, names):
+        # Genre rows for the given names, creating any that do not exist yet.
+        names = list(dict.fromkeys(name for name in names if name))
+        existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))} if names else {}
+        return [existing.get(name) or cls(name=name) for name in names]
+
+# Link tables are keyed (owner, genre) for the detail pages; the reverse
+# (genre, owner) index serves the genre filters.
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_updated_at', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(150))
+    phone = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, lazy=True)
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website_link = db.Column(db.String(500))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    # Shows starting after the upcoming_shows watermark; maintained by counters.py.
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # UTC; stamped on every write by freshness.py.
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    shows = db.relationship('Show', backref='venue', lazy=True)
+
+    def _repr_(self):
+      return f'< Venue {self.id} {self.name} {self.city}>'
+
+    # DONE: implement any missing fields, as a database migration using Flask-Migrate
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_updated_at', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, lazy=True)
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website_link = db.Column(db.String(500))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    shows = db.relationship('Show', backref='artist', lazy=True)
+
+    def _repr_(self):
+      return f'< Artist {self.id} {self.name} {self.city}>'
+
+      
+    # DONE: implement any missing fields, as a database migration using Flask-Migrate
+
+# DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+# A show holds its venue over [start_time, end_time). Shows booked without an
+# end get SHOW_LENGTH, and none may run longer than MAX_SHOW_LENGTH, which
+# bounds the overlap lookups in availability.py.
+SHOW_LENGTH = timedelta(hours=2)
+MAX_SHOW_LENGTH = timedelta(days=1)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + SHOW_LENGTH
+
+
+class Show(db.Model):
+    # On Postgres, migration 8e4f1a6c2b93 partitions this table by month of
+    # start_time (see partitions.py); its primary key there is (id, start_time).
+    __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_updated_at', 'updated_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_time = db.Column(db.DateTime, default=datetime.today(), nullable=False)
+    end_time = db.Column(db.DateTime, default=default_end_time, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Show {self.id} {self.artist_id} {self.venue_id} {self.start_time}>'
+
+    # DONE: implement any missing fields, as a database migration using Flask-Migrate
+
+# DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+
+class Watermark(db.Model):
+    # Named points in time up to which a periodic job has run.
+    __tablename__ = 'Watermark'
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<Watermark {self.name} {self.value}>'
+
+
+@event.listens_for(Watermark.__table__, 'after_create')
+def start_watermarks(table, connection, **kw):
+    # A fresh schema has no shows, so the counters start right at "now".
+    connection.execute(table.insert().values(name='upcoming_shows', value=datetime.now()))
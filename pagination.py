@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import DateTime, literal, tuple_
+
+#----------------------------------------------------------------------------#
+# Cursor pagination helpers.
+#----------------------------------------------------------------------------#
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+  try:
+    size = int(value) if value not in (None, '') else default
+  except (TypeError, ValueError):
+    abort(400)
+  return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+  # An opaque, URL-safe token carrying the sort key of a boundary row.
+  raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(',', ':'))
+  return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, length):
+  if not token:
+    return None
+  try:
+    values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+  except (binascii.Error, ValueError):
+    abort(400)
+  if not isinstance(values, list) or len(values) != length:
+    abort(400)
+  return values
+
+
+def cursor_values(token, keys):
+  # Decode a cursor back into values typed like the key columns, so a
+  # tampered token is a 400 here rather than a database error later.
+  values = decode_cursor(token, len(keys))
+  if values is None:
+    return None
+  try:
+    return [datetime.fromisoformat(v) if isinstance(key.type, DateTime) else key.type.python_type(v)
+            for key, v in zip(keys, values)]
+  except (TypeError, ValueError):
+    abort(400)
+
+
+def keyset_page(query, keys, key_of, after=None, before=None, limit=DEFAULT_PAGE_SIZE, fetch=None):
+  # Seek pagination over an ascending, unique sort key. Every page is one
+  # index range scan of limit + 1 rows, however deep it is. Core selects pass
+  # a fetch callable; ORM queries default to .all().
+  position = tuple_(*keys)
+  after_values = cursor_values(after, keys)
+  before_values = cursor_values(before, keys) if after_values is None else None
+
+  if before_values is not None:
+    query = query.filter(position < tuple_(*[literal(v, key.type) for key, v in zip(keys, before_values)])) \
+      .order_by(*[key.desc() for key in keys])
+  else:
+    if after_values is not None:
+      query = query.filter(position > tuple_(*[literal(v, key.type) for key, v in zip(keys, after_values)]))
+    query = query.order_by(*keys)
+
+  rows = list(fetch(query.limit(limit + 1)) if fetch else query.limit(limit + 1).all())
+  has_more = len(rows) > limit
+  rows = rows[:limit]
+  if before_values is not None:
+    rows.reverse()
+    has_next, has_prev = True, has_more
+  else:
+    has_next, has_prev = has_more, after_values is not None
+
+  return {
+    "data": rows,
+    "next_cursor": encode_cursor(key_of(rows[-1])) if rows and has_next else None,
+    "prev_cursor": encode_cursor(key_of(rows[0])) if rows and has_prev else None,
+  }
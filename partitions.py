@@ -0,0 +1,129 @@
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+#----------------------------------------------------------------------------#
+# Monthly Show partitions (Postgres).
+#----------------------------------------------------------------------------#
+
+# After migration 8e4f1a6c2b93, Show is partitioned by RANGE (start_time):
+# one "Show_pYYYYMM" table per month, plus "Show_default" for rows outside
+# them. Queries bounded on start_time (upcoming shows, the counters' started
+# window) only visit the partitions their range overlaps.
+#
+# `flask partition-shows` keeps partitions created ahead of the bookings, so
+# the default partition stays empty. It also detaches the partitions older than
+# the retention window. A detached partition is an ordinary table renamed to
+# "Show_archive_YYYYMM", which can be dumped and dropped.
+# Each step runs in its own short transaction.
+#
+# Exclusion constraints cannot be declared on the partitioned parent, so every
+# partition carries its own "<name>_no_overlap" (migration c4a9d2e7f1b8).
+
+PARENT = 'Show'
+DEFAULT_PARTITION = 'Show_default'
+PARTITION_NAME = re.compile(r'Show_p(\d{4})(\d{2})')
+
+# Partition DDL waits for the table's readers and writers; give up instead of
+# queueing every new query behind it.
+LOCK_TIMEOUT = '5s'
+
+NO_OVERLAP = "EXCLUDE USING gist (int4range(venue_id, venue_id, '[]') WITH &&, tsrange(start_time, end_time) WITH &&)"
+
+
+class PartitionError(RuntimeError):
+  pass
+
+
+def add_months(month, count):
+  years, index = divmod(month.month - 1 + count, 12)
+  return month.replace(year=month.year + years, month=index + 1)
+
+
+def month_of(moment):
+  return datetime(moment.year, moment.month, 1)
+
+
+def partition_name(month):
+  return f'{PARENT}_p{month:%Y%m}'
+
+
+def is_partitioned(conn):
+  if conn.dialect.name != 'postgresql':
+    return False
+  kind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('\"Show\"')")).scalar()
+  return kind == 'p'
+
+
+def attached_months(conn):
+  # {month: partition name} for the monthly partitions currently attached.
+  rows = conn.execute(text(
+    "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE pg_inherits.inhparent = '\"Show\"'::regclass"
+  ))
+  months = {}
+  for name, in rows:
+    match = PARTITION_NAME.fullmatch(name)
+    if match:
+      months[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+  return months
+
+
+def create_partition(conn, month):
+  # Built detached and filled with whatever the default partition caught for
+  # its month, then attached. Attaching scans only the new table and the
+  # default partition. Returns the number of rows moved.
+  name, upper = partition_name(month), add_months(month, 1)
+  bounds = {'lower': month, 'upper': upper}
+  conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+  conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{PARENT}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+  conn.execute(text(f'ALTER TABLE "{name}" ADD CONSTRAINT "{name}_no_overlap" {NO_OVERLAP}'))
+  moved = conn.execute(text(f"""
+    WITH moved AS (
+      DELETE FROM "{DEFAULT_PARTITION}" WHERE start_time >= :lower AND start_time < :upper RETURNING *
+    )
+    INSERT INTO "{name}" SELECT * FROM moved
+  """), bounds).rowcount
+  conn.execute(text(f'ALTER TABLE "{PARENT}" ATTACH PARTITION "{name}" '
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"))
+  return moved
+
+
+def archive_partition(conn, month, name, drop=False):
+  conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+  conn.execute(text(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{name}"'))
+  if drop:
+    conn.execute(text(f'DROP TABLE "{name}"'))
+    return None
+  archive = f'{PARENT}_archive_{month:%Y%m}'
+  conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{archive}"'))
+  return archive
+
+
+def maintain(engine, ahead=12, keep=None, drop=False, now=None, report=None):
+  # Creates the partitions for this month and the next `ahead`, and detaches
+  # those that ended more than `keep` months before this month (None keeps
+  # everything). Detaching never reaches the current month.
+  report = report or (lambda message: None)
+  now = now or datetime.now()
+  current = month_of(now)
+  with engine.connect() as conn:
+    if not is_partitioned(conn):
+      raise PartitionError('Show is not partitioned; run `flask db upgrade` on PostgreSQL first')
+    months = attached_months(conn)
+
+  for offset in range(ahead + 1):
+    month = add_months(current, offset)
+    if month not in months:
+      with engine.begin() as conn:
+        moved = create_partition(conn, month)
+      report(f'created {partition_name(month)}' + (f', moved {moved} rows from {DEFAULT_PARTITION}' if moved else ''))
+
+  if keep is not None:
+    cutoff = add_months(current, -max(keep, 0))
+    for month, name in sorted(months.items()):
+      if month < cutoff:
+        with engine.begin() as conn:
+          archive = archive_partition(conn, month, name, drop)
+        report(f'dropped {name}' if archive is None else f'detached {name} as {archive}')
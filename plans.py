@@ -0,0 +1,100 @@
+import re
+import time
+
+import click
+from sqlalchemy import event, func
+
+from models import db, Venue, Artist
+from routing import STICKY_COOKIE
+
+#----------------------------------------------------------------------------#
+# Query-plan regression check.
+#----------------------------------------------------------------------------#
+
+# A plan line that reads the whole Show table (or a whole monthly partition of
+# it) instead of going through an index.
+SEQ_SCAN_ON_SHOW = {
+  'postgresql': re.compile(r'Seq Scan on "?Show(_p\d{6}|_default)?"?(\s|$)'),
+  'sqlite': re.compile(r'\bSCAN (TABLE )?Show\b(?! USING)'),
+}
+
+
+def plan_routes():
+  # Every read route, pointed at rows that exist in the seeded database.
+  venue_id = db.session.query(func.min(Venue.id)).scalar()
+  artist_id = db.session.query(func.min(Artist.id)).scalar()
+  db.session.close()
+  return [
+    ('GET', '/venues', None),
+    ('GET', '/venues?genre=Jazz&state=CA', None),
+    ('GET', '/artists', None),
+    ('GET', '/artists?genre=Jazz', None),
+    ('GET', '/shows', None),
+    ('GET', f'/venues/{venue_id}', None),
+    ('GET', f'/artists/{artist_id}', None),
+    ('POST', '/venues/search', {'search_term': 'a'}),
+    ('POST', '/artists/search', {'search_term': 'a'}),
+  ]
+
+
+def capture_statements(app, method, path, data=None):
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith('SELECT'):
+      statements.append((statement, parameters))
+
+  # A cached page issues no SQL, so the page cache is bypassed while capturing.
+  page_cache = app.extensions.get('page_cache')
+  backend = page_cache.backend if page_cache else None
+  if page_cache:
+    page_cache.backend = None
+  # Read-only views would run on a replica, out of sight of the listener;
+  # the read-your-writes cookie keeps them on the primary, where they are explained.
+  client = app.test_client()
+  client.set_cookie('localhost', STICKY_COOKIE, f'{time.time() + 60:.3f}')
+  event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    client.open(path, method=method, data=data)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    if page_cache:
+      page_cache.backend = backend
+  return statements
+
+
+def explain(statement, parameters):
+  dialect = db.engine.dialect.name
+  with db.engine.connect() as conn:
+    if dialect == 'postgresql':
+      # With sequential scans priced out, the planner only picks one when no index applies.
+      conn.exec_driver_sql('SET enable_seqscan = off')
+      rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+      conn.exec_driver_sql('RESET enable_seqscan')
+      return [row[0] for row in rows]
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_plans(app):
+  pattern = SEQ_SCAN_ON_SHOW.get(db.engine.dialect.name)
+  if pattern is None:
+    raise click.ClickException(f'No plan check for the {db.engine.dialect.name} dialect.')
+
+  failures = []
+  for method, path, data in plan_routes():
+    statements = capture_statements(app, method, path, data)
+    if not statements:
+      # Nothing captured would otherwise pass without checking anything.
+      raise click.ClickException(f'{method} {path} issued no SELECT on the primary; nothing to check.')
+    for statement, parameters in statements:
+      plan = explain(statement, parameters)
+      bad = [line for line in plan if pattern.search(line)]
+      click.echo(f"{'FAIL' if bad else 'ok  '} {method} {path}: {' '.join(statement.split())[:100]}")
+      if bad:
+        failures.append((method, path, statement, plan))
+
+  for method, path, statement, plan in failures:
+    click.echo(f'\n{method} {path} scans "Show" sequentially:\n{statement}\n' + '\n'.join(plan), err=True)
+  if failures:
+    raise click.ClickException(f'{len(failures)} statement(s) fall back to a sequential scan on "Show".')
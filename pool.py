@@ -0,0 +1,72 @@
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Connection pool instrumentation.
+#----------------------------------------------------------------------------#
+
+class TimedQueuePool(QueuePool):
+  # QueuePool that records how long checkouts wait for a connection.
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.checkouts = 0
+    self.timeouts = 0
+    self.wait_total = 0.0
+    self.wait_max = 0.0
+
+  def _do_get(self):
+    started = time.perf_counter()
+    try:
+      return super()._do_get()
+    except exc.TimeoutError:
+      self.timeouts += 1
+      raise
+    finally:
+      waited = time.perf_counter() - started
+      self.checkouts += 1
+      self.wait_total += waited
+      self.wait_max = max(self.wait_max, waited)
+
+
+def pool_stats(engine):
+  pool = engine.pool
+  stats = {"pool": type(pool).__name__, "status": pool.status()}
+  if isinstance(pool, QueuePool):
+    stats.update({
+      "size": pool.size(),
+      "checked_out": pool.checkedout(),
+      "idle": pool.checkedin(),
+      # overflow() counts down from -size while the core pool is filling up.
+      "overflow": max(pool.overflow(), 0),
+    })
+  if isinstance(pool, TimedQueuePool):
+    stats.update({
+      "checkouts": pool.checkouts,
+      "timeouts": pool.timeouts,
+      "wait_total_ms": round(pool.wait_total * 1000, 3),
+      "wait_avg_ms": round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+      "wait_max_ms": round(pool.wait_max * 1000, 3),
+    })
+  return stats
+
+
+def init_app(app):
+  # PgBouncer in transaction mode rejects the "options" startup parameter and
+  # hands server connections between clients, so the statement timeout is set
+  # per transaction there instead of per connection.
+  timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+  if not (app.config.get('DB_PGBOUNCER') and timeout):
+    return
+
+  @event.listens_for(Engine, 'begin')
+  def set_local_statement_timeout(conn):
+    if conn.dialect.name == 'postgresql':
+      # Straight to the DBAPI cursor: psycopg2 and the asyncpg adapter both
+      # open the transaction implicitly on the first statement.
+      cursor = conn.connection.cursor()
+      cursor.execute(f'SET LOCAL statement_timeout = {int(timeout)}')
+      cursor.close()
@@ -0,0 +1,123 @@
+import json
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Per-request SQL and render profiling.
+#----------------------------------------------------------------------------#
+
+# Opt in with PROFILE_REQUESTS. Each request gets a Server-Timing header and
+# one JSON log line, plus a warning for every statement shape repeated more
+# than PROFILE_REPEAT_THRESHOLD times (the usual N+1 signature).
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|:\w+|\$\d+")
+PLACEHOLDER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def normalize(statement):
+  # Same shape, different parameters -> same string.
+  statement = LITERALS.sub('?', ' '.join(statement.split()))
+  return PLACEHOLDER_LISTS.sub('(?)', statement)
+
+
+class RequestProfile:
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.statements = []
+    self.render_time = 0.0
+
+  @property
+  def db_time(self):
+    return sum(elapsed for _, elapsed in self.statements)
+
+  def repeated(self, threshold):
+    counts = Counter(normalize(statement) for statement, _ in self.statements)
+    return {statement: count for statement, count in counts.items() if count > threshold}
+
+  def slowest(self, limit):
+    return sorted(self.statements, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def current_profile():
+  return g.get('profile') if has_request_context() else None
+
+
+class TimedTemplate(Template):
+  # Charges Jinja render time to the current request.
+
+  def render(self, *args, **kwargs):
+    profile = current_profile()
+    if profile is None:
+      return super().render(*args, **kwargs)
+    started = time.perf_counter()
+    try:
+      return super().render(*args, **kwargs)
+    finally:
+      profile.render_time += time.perf_counter() - started
+
+
+# The start time lives on the statement's execution context, which is dropped
+# with it, so a statement that raises leaves nothing behind on the connection.
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  context._profile_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  started = context._profile_started
+  profile = current_profile()
+  if profile is not None:
+    profile.statements.append((statement, time.perf_counter() - started))
+
+
+def init_app(app):
+  if not app.config.get('PROFILE_REQUESTS'):
+    return
+  slow_limit = app.config.get('PROFILE_SLOW_STATEMENTS', 3)
+  threshold = app.config.get('PROFILE_REPEAT_THRESHOLD', 5)
+
+  app.jinja_env.template_class = TimedTemplate
+  event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+  event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+  @app.before_request
+  def start_profile():
+    g.profile = RequestProfile()
+
+  @app.after_request
+  def report_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+      return response
+    total = time.perf_counter() - profile.started
+    db_time = profile.db_time
+    response.headers.add('Server-Timing', ', '.join([
+      f'db;dur={db_time * 1000:.2f};desc="{len(profile.statements)} queries"',
+      f'render;dur={profile.render_time * 1000:.2f}',
+      f'total;dur={total * 1000:.2f}',
+    ]))
+
+    repeated = profile.repeated(threshold)
+    for statement, count in repeated.items():
+      app.logger.warning(f'Possible N+1 on {request.method} {request.path}: {count} runs of {statement[:200]}')
+    app.logger.info(json.dumps({
+      "event": "request_profile",
+      "method": request.method,
+      "path": request.full_path.rstrip('?'),
+      "endpoint": request.endpoint,
+      "status": response.status_code,
+      "total_ms": round(total * 1000, 2),
+      "db_ms": round(db_time * 1000, 2),
+      "render_ms": round(profile.render_time * 1000, 2),
+      "queries": len(profile.statements),
+      "slowest": [{"ms": round(elapsed * 1000, 2), "sql": normalize(statement)[:300]}
+                  for statement, elapsed in profile.slowest(slow_limit)],
+      "repeated": repeated,
+    }))
+    return response
@@ -0,0 +1,221 @@
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import String
+
+from counters import upcoming_counts
+from models import db, Genre, Venue, Artist, Show, venue_genres, artist_genres
+from pagination import DEFAULT_PAGE_SIZE, keyset_page
+
+#----------------------------------------------------------------------------#
+# Read queries shared by the views.
+#----------------------------------------------------------------------------#
+
+class aggregate_strings(FunctionElement):
+  # string_agg() on Postgres, group_concat() on SQLite.
+  type = String()
+  inherit_cache = True
+  name = 'aggregate_strings'
+
+
+@compiles(aggregate_strings)
+def compile_aggregate_strings(element, compiler, **kw):
+  return 'string_agg(%s)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(aggregate_strings, 'sqlite')
+def compile_aggregate_strings_sqlite(element, compiler, **kw):
+  return 'group_concat(%s)' % compiler.process(element.clauses, **kw)
+
+
+GENRE_SEPARATOR = ','
+
+
+def genre_names(link_table, owner_column, owner_id):
+  # Correlated scalar subquery: the owner's genre names in one string.
+  return select(aggregate_strings(Genre.name, GENRE_SEPARATOR)) \
+    .select_from(link_table.join(Genre, Genre.id == link_table.c.genre_id)) \
+    .where(owner_column == owner_id) \
+    .scalar_subquery()
+
+
+def split_genres(value):
+  return sorted(value.split(GENRE_SEPARATOR)) if value else []
+
+
+def with_genre(link_table, owner_column, genre):
+  # Owner ids tagged with a genre, read from the (genre_id, owner_id) index.
+  return select(owner_column).join(Genre, Genre.id == link_table.c.genre_id).where(Genre.name == genre)
+
+
+# ---------------------------------------------------------------------------#
+# Venues grouped by city and state
+# ---------------------------------------------------------------------------#
+def venue_areas(now=None, genre=None, state=None):
+  # One statement regardless of catalogue size: every venue with its
+  # upcoming-show count, ordered so that areas come out contiguous. Counts
+  # come from the maintained counters (counters.py), so the statement reads
+  # each venue once plus the shows that started since the last aging run.
+  now = now or datetime.now()
+  started, upcoming = upcoming_counts(Venue, now)
+  query = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, upcoming.label('num_upcoming_shows')) \
+    .outerjoin(started, started.c.owner_id == Venue.id)
+  if genre:
+    query = query.filter(Venue.id.in_(with_genre(venue_genres, venue_genres.c.venue_id, genre)))
+  if state:
+    query = query.filter(Venue.state == state)
+  rows = query.order_by(Venue.state, Venue.city, Venue.id).all()
+
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.num_upcoming_shows,
+      } for venue in venues],
+    })
+  return areas
+
+
+# ---------------------------------------------------------------------------#
+# Paginated listings
+# ---------------------------------------------------------------------------#
+def artist_page(after=None, before=None, limit=DEFAULT_PAGE_SIZE, genre=None, state=None):
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = query.filter(Artist.id.in_(with_genre(artist_genres, artist_genres.c.artist_id, genre)))
+  if state:
+    query = query.filter(Artist.state == state)
+  return keyset_page(query, [Artist.id], lambda artist: (artist.id,), after, before, limit)
+
+
+def show_page(after=None, before=None, limit=DEFAULT_PAGE_SIZE, session=None):
+  return keyset_page(show_rows_select(), [Show.start_time, Show.id], lambda show: (show.start_time, show.id),
+                     after, before, limit, fetch=lambda statement: fetch_show_rows(statement, session))
+
+
+# ---------------------------------------------------------------------------#
+# Projection-only show rows
+# ---------------------------------------------------------------------------#
+# The shows listing reads only these columns (plus the id for its cursor), so
+# it selects them with Core and never builds ORM instances or identity-map entries.
+ShowRow = namedtuple('ShowRow', ['id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time'])
+
+
+def show_rows_select():
+  return select(
+    Show.id,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.start_time,
+  ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+
+
+def fetch_show_rows(statement, session=None):
+  session = db.session if session is None else session
+  return [ShowRow._make(row) for row in session.connection().execute(statement)]
+
+
+# ---------------------------------------------------------------------------#
+# Detail pages
+# ---------------------------------------------------------------------------#
+# Like show_page, these take an optional session so the async views in
+# asgi.py can run them unchanged through AsyncSession.run_sync.
+def split_shows(rows, show_fields, now):
+  # One pass over the joined rows, against a single "now" snapshot.
+  past, upcoming = [], []
+  for row in rows:
+    if row.start_time is None:
+      # The entity has no shows; the outer join still returns its row.
+      continue
+    show = {field: getattr(row, field) for field in show_fields}
+    (upcoming if row.start_time > now else past).append(show)
+  return {
+    "past_shows": past,
+    "upcoming_shows": upcoming,
+    "past_shows_count": len(past),
+    "upcoming_shows_count": len(upcoming),
+  }
+
+
+def venue_detail(venue_id, now=None, session=None):
+  now = now or datetime.now()
+  session = db.session if session is None else session
+  statement = select(
+    Venue.id, Venue.name, genre_names(venue_genres, venue_genres.c.venue_id, Venue.id).label('genres'), Venue.address, Venue.city, Venue.state, Venue.phone,
+    Venue.website_link, Venue.facebook_link, Venue.seeking_talent, Venue.seeking_description, Venue.image_link,
+    Artist.id.label('artist_id'),
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.start_time,
+  ).outerjoin(Show, Show.venue_id == Venue.id) \
+    .outerjoin(Artist, Artist.id == Show.artist_id) \
+    .where(Venue.id == venue_id) \
+    .order_by(Show.start_time, Show.id)
+  rows = session.connection().execute(statement).all()
+  if not rows:
+    return None
+
+  venue = rows[0]
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": split_genres(venue.genres),
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website_link,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+  }
+  data.update(split_shows(rows, ('artist_id', 'artist_name', 'artist_image_link', 'start_time'), now))
+  return data
+
+
+def artist_detail(artist_id, now=None, session=None):
+  now = now or datetime.now()
+  session = db.session if session is None else session
+  statement = select(
+    Artist.id, Artist.name, genre_names(artist_genres, artist_genres.c.artist_id, Artist.id).label('genres'), Artist.city, Artist.state, Artist.phone,
+    Artist.website_link, Artist.facebook_link, Artist.seeking_venue, Artist.seeking_description, Artist.image_link,
+    Venue.id.label('venue_id'),
+    Venue.name.label('venue_name'),
+    Venue.image_link.label('venue_image_link'),
+    Show.start_time,
+  ).outerjoin(Show, Show.artist_id == Artist.id) \
+    .outerjoin(Venue, Venue.id == Show.venue_id) \
+    .where(Artist.id == artist_id) \
+    .order_by(Show.start_time, Show.id)
+  rows = session.connection().execute(statement).all()
+  if not rows:
+    return None
+
+  artist = rows[0]
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": split_genres(artist.genres),
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website_link,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+  }
+  data.update(split_shows(rows, ('venue_id', 'venue_name', 'venue_image_link', 'start_time'), now))
+  return data
@@ -0,0 +1,142 @@
+import itertools
+import math
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm, text
+
+#----------------------------------------------------------------------------#
+# Read-replica routing.
+#----------------------------------------------------------------------------#
+
+# Views marked read_only run their queries on a replica, picked round-robin
+# among the healthy ones once per request. Everything else, every flush, and
+# any client inside its read-your-writes window after a write goes to the
+# primary.
+
+STICKY_COOKIE = 'fyyur_primary_until'
+
+
+def read_only(view):
+  # Marks a view whose queries may be served by a replica.
+  view.read_only = True
+  return view
+
+
+class Replica:
+
+  def __init__(self, url, engine_options):
+    self.engine = create_engine(url, **engine_options)
+    self.healthy = True
+    self.checked_at = 0.0
+    self.reads = 0
+    self.failures = 0
+
+  def check(self):
+    try:
+      with self.engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+      self.healthy = True
+    except Exception:
+      self.healthy = False
+      self.failures += 1
+    self.checked_at = time.monotonic()
+
+  def stats(self):
+    return {
+      "url": self.engine.url.render_as_string(hide_password=True),
+      "healthy": self.healthy,
+      "reads": self.reads,
+      "failures": self.failures,
+    }
+
+
+class ReplicaSet:
+
+  def __init__(self, app):
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    self.replicas = [Replica(url, options) for url in app.config.get('SQLALCHEMY_REPLICA_URIS', [])]
+    self.health_interval = app.config.get('REPLICA_HEALTH_INTERVAL', 10)
+    self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+    self.lock = threading.Lock()
+    self.cycle = itertools.cycle(self.replicas)
+
+  def refresh_health(self):
+    # Lazy health checks: at most one request per interval pays for a probe.
+    now = time.monotonic()
+    with self.lock:
+      stale = [replica for replica in self.replicas if now - replica.checked_at >= self.health_interval]
+      for replica in stale:
+        replica.checked_at = now
+    for replica in stale:
+      replica.check()
+
+  def choose(self):
+    if not self.replicas:
+      return None
+    self.refresh_health()
+    with self.lock:
+      for _ in range(len(self.replicas)):
+        replica = next(self.cycle)
+        if replica.healthy:
+          replica.reads += 1
+          return replica
+    return None
+
+
+def reads_from_replica():
+  if not has_request_context():
+    return False
+  view = current_app.view_functions.get(request.endpoint)
+  if not getattr(view, 'read_only', False):
+    return False
+  try:
+    return float(request.cookies.get(STICKY_COOKIE, 0)) < time.time()
+  except ValueError:
+    return True
+
+
+def replica_engine():
+  # The replica engine for this request, or None for the primary.
+  if not reads_from_replica():
+    return None
+  if 'replica' not in g:
+    g.replica = current_app.extensions['replicas'].choose()
+  return g.replica.engine if g.replica else None
+
+
+class RoutingSession(SignallingSession):
+
+  def get_bind(self, mapper=None, clause=None):
+    if not self._flushing:
+      engine = replica_engine()
+      if engine is not None:
+        return engine
+    return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def read_engine(self):
+    # For Core reads outside the session, such as streaming exports.
+    return replica_engine() or self.engine
+
+
+def init_app(app):
+  app.extensions['replicas'] = replicas = ReplicaSet(app)
+
+  @app.after_request
+  def stick_to_primary(response):
+    # Read-your-writes: after a write, this client reads from the primary for a while.
+    view = app.view_functions.get(request.endpoint)
+    if replicas.replicas and request.method not in ('GET', 'HEAD', 'OPTIONS') and not getattr(view, 'read_only', False):
+      until = time.time() + replicas.sticky_seconds
+      response.set_cookie(STICKY_COOKIE, f'{until:.3f}', max_age=math.ceil(replicas.sticky_seconds), httponly=True)
+    return response
+
+  return replicas
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from availability import check_bookings
+from counters import count_inserted_shows
+from freshness import touch
+from importer import reserve_ids
+from models import db, Venue, Artist, Show, SHOW_LENGTH
+
+#----------------------------------------------------------------------------#
+# Bulk and recurring show scheduling.
+#----------------------------------------------------------------------------#
+
+# A schedule books one artist at one venue for many start times: a list of
+# slots, or a start time repeated daily or weekly. It is expanded here and
+# written as one multi-row INSERT in the caller's transaction. Core inserts
+# skip the session's flush hooks, so this does their work itself: the venue's
+# and artist's updated_at, the upcoming-show counters and the double-booking
+# check. The caller commits and evicts the cached pages.
+
+REPEATS = {'daily': timedelta(days=1), 'weekly': timedelta(weeks=1)}
+
+# Keeps one schedule to one statement of a bounded size.
+MAX_SHOWS = 500
+
+
+class ScheduleError(ValueError):
+  pass
+
+
+def parse_time(value, field):
+  try:
+    return datetime.fromisoformat(value)
+  except (TypeError, ValueError):
+    raise ScheduleError(f'{field} must be an ISO 8601 date and time, got {value!r}')
+
+
+def positive_int(value, field):
+  if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+    raise ScheduleError(f'{field} must be a positive integer')
+  return value
+
+
+def expand(spec):
+  # The sorted, distinct start times a schedule describes:
+  #   {"slots": ["2026-11-06T21:00:00", ...]}, or
+  #   {"start_time": ..., "repeat": "daily"|"weekly", "interval": 1, "count": N | "until": ...}
+  if 'slots' in spec:
+    if 'repeat' in spec:
+      raise ScheduleError('Give either slots or a repeat rule, not both')
+    slots = spec['slots']
+    if not isinstance(slots, list) or not slots:
+      raise ScheduleError('slots must be a non-empty list')
+    if len(slots) > MAX_SHOWS:
+      raise ScheduleError(f'At most {MAX_SHOWS} shows per schedule')
+    return sorted({parse_time(slot, 'slot') for slot in slots})
+
+  start = parse_time(spec.get('start_time'), 'start_time')
+  repeat = spec.get('repeat')
+  if repeat not in REPEATS:
+    raise ScheduleError(f'repeat must be one of {", ".join(REPEATS)}')
+  step = REPEATS[repeat] * positive_int(spec.get('interval', 1), 'interval')
+  if ('count' in spec) == ('until' in spec):
+    raise ScheduleError('Give exactly one of count and until')
+  if 'count' in spec:
+    count = positive_int(spec['count'], 'count')
+  else:
+    until = parse_time(spec['until'], 'until')
+    if until < start:
+      raise ScheduleError('until is before start_time')
+    count = (until - start) // step + 1
+  if count > MAX_SHOWS:
+    raise ScheduleError(f'At most {MAX_SHOWS} shows per schedule')
+  return [start + step * index for index in range(count)]
+
+
+def schedule_shows(spec, session=None):
+  # Inserts the shows a schedule describes and returns their ids, in
+  # start-time order. Each lasts "duration" minutes, SHOW_LENGTH by default.
+  # Raises BookingConflict if one would overlap a show at the venue. The
+  # caller commits.
+  session = db.session if session is None else session
+  if not isinstance(spec, dict):
+    raise ScheduleError('Expected a JSON object')
+  venue_id = positive_int(spec.get('venue_id'), 'venue_id')
+  artist_id = positive_int(spec.get('artist_id'), 'artist_id')
+  length = timedelta(minutes=positive_int(spec['duration'], 'duration')) if 'duration' in spec else SHOW_LENGTH
+  start_times = expand(spec)
+
+  conn = session.connection()
+  if conn.execute(select(Venue.id).where(Venue.id == venue_id)).first() is None:
+    raise ScheduleError(f'No venue {venue_id}')
+  if conn.execute(select(Artist.id).where(Artist.id == artist_id)).first() is None:
+    raise ScheduleError(f'No artist {artist_id}')
+
+  check_bookings(conn, [(venue_id, start_time, start_time + length) for start_time in start_times])
+  now = datetime.utcnow()
+  ids = reserve_ids(conn, Show.__table__, len(start_times))
+  rows = [{'id': id, 'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time,
+           'end_time': start_time + length, 'updated_at': now}
+          for id, start_time in zip(ids, start_times)]
+  conn.execute(Show.__table__.insert().values(rows))
+  touch(conn, Venue, {venue_id}, now)
+  touch(conn, Artist, {artist_id}, now)
+  count_inserted_shows(conn, rows)
+  return ids
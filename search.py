@@ -0,0 +1,97 @@
+import sqlite3
+
+from flask import abort
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.engine import Engine
+
+from models import db
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+
+COUNT_CAP = 1000
+
+#----------------------------------------------------------------------------#
+# Name search.
+#----------------------------------------------------------------------------#
+
+# On Postgres the ILIKE below is answered from the pg_trgm GIN index on
+# "name" and ranked with pg_trgm's similarity(). SQLite has neither, so the
+# same similarity() is registered on every SQLite connection in Python.
+
+def trigrams(value):
+  # Mirrors pg_trgm: lower-cased words, padded with two leading blanks and one trailing.
+  grams = set()
+  for word in ''.join(c if c.isalnum() else ' ' for c in (value or '').lower()).split():
+    padded = f'  {word} '
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+  return grams
+
+
+def similarity(left, right):
+  left, right = trigrams(left), trigrams(right)
+  if not left or not right:
+    return 0.0
+  return len(left & right) / len(left | right)
+
+
+@event.listens_for(Engine, 'connect')
+def register_similarity(dbapi_connection, connection_record):
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    dbapi_connection.create_function('similarity', 2, similarity, deterministic=True)
+
+
+def escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def match_name(model, search_term):
+  # Case-insensitive partial match on name.
+  return model.name.ilike(f'%{escape_like(search_term)}%', escape='\\')
+
+
+def count_matches(model, search_term, cap=COUNT_CAP, session=None):
+  # Counting stops after cap + 1 index hits, so broad terms stay cheap.
+  session = db.session if session is None else session
+  matches = session.query(model.id).filter(match_name(model, search_term)).limit(cap + 1).subquery()
+  count = session.query(func.count()).select_from(matches).scalar()
+  return min(count, cap), count > cap
+
+
+def search_page(model, search_term, cursor=None, limit=DEFAULT_PAGE_SIZE, session=None):
+  # One page of (id, name, rank) rows, best matches first, plus a capped total.
+  session = db.session if session is None else session
+  rank = func.similarity(model.name, search_term)
+  query = session.query(model.id, model.name, rank.label('rank')).filter(match_name(model, search_term))
+
+  after = decode_cursor(cursor, 3)
+  if after is not None:
+    try:
+      after_rank, after_name, after_id = float(after[0]), after[1], int(after[2])
+    except (TypeError, ValueError):
+      abort(400)
+    if not isinstance(after_name, str):
+      abort(400)
+    query = query.filter(or_(
+      rank < after_rank,
+      and_(rank == after_rank, model.name > after_name),
+      and_(rank == after_rank, model.name == after_name, model.id > after_id),
+    ))
+
+  rows = query.order_by(rank.desc(), model.name, model.id).limit(limit + 1).all()
+  data = rows[:limit]
+  last = data[-1] if data else None
+  count, count_capped = count_matches(model, search_term, session=session)
+  return {
+    "count": count,
+    "count_capped": count_capped,
+    "data": data,
+    "next_cursor": encode_cursor((last.rank, last.name, last.id)) if len(rows) > limit else None,
+  }
+
+
+def search_json(results):
+  return {
+    "count": results["count"],
+    "count_capped": results["count_capped"],
+    "data": [{"id": row.id, "name": row.name} for row in results["data"]],
+    "next_cursor": results["next_cursor"],
+  }